@@ -0,0 +1,236 @@
+"""
+End-to-end ingestion benchmark. Generates synthetic course zips, runs them
+through digesting, embedding, upserting, graph building and search against
+an in-memory Qdrant and a deterministic fake embedder, and reports latency,
+throughput and peak memory per stage. No Ollama or Qdrant server is needed.
+
+    python bench_ingest.py
+"""
+import asyncio
+import hashlib
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from pathlib import Path
+
+# Must be set before the project modules read their configuration. The benchmark
+# deletes the collection and clears the caches it uses, so every store is pinned to
+# scratch locations, whatever the environment says.
+BENCH_DIR = Path(tempfile.mkdtemp(prefix="bench_ingest_"))
+os.environ["QDRANT_LOCATION"] = ":memory:"
+os.environ["EMBEDDING_CACHE_PATH"] = str(BENCH_DIR / "embedding_cache.sqlite3")
+os.environ["LEXICAL_INDEX_PATH"] = str(BENCH_DIR / "lexical.sqlite3")
+os.environ["UPLOAD_DIR"] = str(BENCH_DIR / "uploads")
+
+import fitz
+import numpy as np
+
+from config import settings
+from digesting import digest_directory, iter_zip_chunks
+from graph import build_concept_graph
+from lexical import lexical_index
+from pipeline import ingest_zip
+from search import query_cache, result_cache, search
+from store import ensure_collection, resolve_alias
+from vectorizer import add_chunks_to_qdrant, client, embed_chunks, embedding_cache, run, use_embedding_client, COLLECTION_NAME
+
+# --- Configuration ---
+BENCH_EMBED_LATENCY = float(os.environ.get("BENCH_EMBED_LATENCY", 0.0))  # simulated seconds per embedding request
+BENCH_QUERIES = 100  # search queries timed per retrieval mode
+FAILURE_TIMEOUT = 10  # seconds a failed ingestion may take to give up before it counts as hung
+
+# name -> (pdf files, text files, pages per pdf, paragraphs per page or text file)
+SCENARIOS = {
+    "text only": (0, 40, 0, 30),
+    "mixed": (10, 10, 8, 6),
+    "large pdfs": (6, 0, 40, 6),
+}
+
+WORDS = (
+    "probability variance estimator hypothesis sample bayes prior posterior likelihood "
+    "distribution random variable expectation interval confidence test statistic mean "
+    "median regression model theorem proof lemma integral derivative matrix vector "
+    "the a of and to in is that for with as by on are this be from"
+).split()
+
+
+class FakeEmbedder:
+    """Deterministic stand-in for ollama.AsyncClient: vectors are derived from a hash of the text."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def embed(self, model, input):
+        if BENCH_EMBED_LATENCY:
+            await asyncio.sleep(BENCH_EMBED_LATENCY)
+        return FakeEmbedResponse([self.vector(text) for text in input])
+
+    @staticmethod
+    def vector(text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(settings.vector_size).astype(np.float32).tolist()
+
+
+class FakeEmbedResponse:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+
+# --- Synthetic courses ---
+def _paragraph(rng):
+    sentences = []
+    for _ in range(rng.randint(3, 7)):
+        words = rng.choices(WORDS, k=rng.randint(8, 20))
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def make_course_zip(zip_path: Path, pdfs: int, texts: int, pages: int, paragraphs: int, seed: int = 0):
+    """Write a course zip with the given mix of PDF and text files of generated prose."""
+    rng = random.Random(seed)
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for i in range(pdfs):
+            doc = fitz.open()
+            for _ in range(pages):
+                page = doc.new_page()
+                text = "\n\n".join(_paragraph(rng) for _ in range(paragraphs))
+                page.insert_textbox(page.rect + (50, 50, -50, -50), text, fontsize=8)
+            zf.writestr(f"course/lecture{i:03d}.pdf", doc.tobytes())
+            doc.close()
+        for i in range(texts):
+            text = "\n\n".join(_paragraph(rng) for _ in range(paragraphs))
+            zf.writestr(f"course/notes{i:03d}.txt", text)
+    return zip_path
+
+
+# --- Measurement ---
+class Stage:
+    """Times a block and records its peak traced Python memory."""
+
+    def __init__(self, results, name, items_label="chunks"):
+        self.results = results
+        self.name = name
+        self.items_label = items_label
+        self.items = 0
+
+    def __enter__(self):
+        tracemalloc.start()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.results.append({
+            "stage": self.name,
+            "seconds": elapsed,
+            "items": self.items,
+            "per_second": self.items / elapsed if elapsed else 0.0,
+            "unit": self.items_label,
+            "peak_mb": peak / 2 ** 20,
+        })
+
+
+def _reset_collection():
+    target = resolve_alias(client, COLLECTION_NAME)
+    if target is not None:
+        client.delete_collection(target)
+    ensure_collection(client, COLLECTION_NAME)
+    lexical_index.clear()
+
+
+async def bench_scenario(zip_path: Path):
+    """Run every ingestion stage on one course zip and return the per-stage results."""
+    results = []
+
+    with Stage(results, "zip digest") as stage:
+        chunks = [chunk for _, chunk in iter_zip_chunks(zip_path)]
+        stage.items = len(chunks)
+
+    directory = BENCH_DIR / f"{zip_path.stem}_extracted"
+    with zipfile.ZipFile(zip_path) as zf:
+        zf.extractall(directory)
+    with Stage(results, "digest_directory") as stage:
+        stage.items = len(digest_directory(directory))
+
+    embedding_cache.clear()
+    with Stage(results, "embed (cold)") as stage:
+        await embed_chunks(chunks)
+        stage.items = len(chunks)
+
+    _reset_collection()
+    with Stage(results, "upsert (cached)") as stage:
+        for i in range(0, len(chunks), 256):
+            await add_chunks_to_qdrant(chunks[i:i + 256])
+        stage.items = len(chunks)
+
+    with Stage(results, "concept graph", "nodes") as stage:
+        stage.items = build_concept_graph(client, COLLECTION_NAME)
+
+    # Queries of three words taken from the chunks, answered by each retrieval mode
+    queries = [" ".join(chunk.split()[:3]) for chunk in chunks[:BENCH_QUERIES]]
+    for mode in ("lexical", "vector", "hybrid"):
+        query_cache.clear()
+        result_cache.clear()
+        with Stage(results, f"search ({mode})", "queries") as stage:
+            for query in queries:
+                await search(query, mode=mode)
+            stage.items = len(queries)
+
+    embedding_cache.clear()
+    _reset_collection()
+    with Stage(results, "ingest_zip end-to-end") as stage:
+        stage.items = await ingest_zip(zip_path)
+
+    return results
+
+
+async def check_failed_batch(zip_path: Path):
+    """
+    Regression check: a batch that fails after the parser has already
+    finished must fail the ingestion instead of hanging it.
+    """
+    def fail(file_paths, point_ids):
+        raise RuntimeError("injected batch failure")
+
+    try:
+        await asyncio.wait_for(ingest_zip(zip_path, on_batch=fail, build_graph=False), FAILURE_TIMEOUT)
+    except RuntimeError:
+        print("Failed batch check: ingestion failed cleanly")
+        return
+    except asyncio.TimeoutError:
+        raise AssertionError(f"ingestion hung for {FAILURE_TIMEOUT}s after a failed batch") from None
+    raise AssertionError("ingestion succeeded despite a failed batch")
+
+
+def run_benchmark(scenarios=SCENARIOS):
+    use_embedding_client(FakeEmbedder)
+    os.chdir(BENCH_DIR)  # extracted courses and anything else written relative to the working directory
+    try:
+        run(check_failed_batch(make_course_zip(BENCH_DIR / "failing.zip", 0, 3, 0, 3)))
+        for name, (pdfs, texts, pages, paragraphs) in scenarios.items():
+            zip_path = make_course_zip(BENCH_DIR / f"{name.replace(' ', '_')}.zip", pdfs, texts, pages, paragraphs)
+            size_mb = zip_path.stat().st_size / 2 ** 20
+            print(f"\n=== {name}: {pdfs} PDFs x {pages} pages, {texts} text files, {size_mb:.1f}MB zip ===")
+            results = run(bench_scenario(zip_path))
+
+            print(f"{'stage':<24} {'seconds':>8} {'items':>7} {'throughput':>18} {'peak':>9}")
+            for result in results:
+                rate = f"{result['per_second']:.1f} {result['unit']}/s"
+                print(f"{result['stage']:<24} {result['seconds']:>8.2f} {result['items']:>7} {rate:>18} {result['peak_mb']:>7.1f}MB")
+    finally:
+        use_embedding_client()
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+    # ru_maxrss is in kilobytes on Linux
+    print(f"\nPeak RSS of the benchmark process: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,129 @@
+"""
+Compare storage layouts for the chunk collection: estimated RAM, recall@k
+against exact numpy search, and query latency. Run against a Qdrant server,
+since local mode ignores quantization and HNSW settings.
+
+    python bench_storage.py
+"""
+import os
+import time
+import uuid
+
+import numpy as np
+from qdrant_client.http.models import CollectionStatus, OptimizersConfigDiff, PointStruct
+
+from config import settings
+from knn import normalize
+from store import create_collection, estimate_memory, get_client, search_params
+
+# --- Configuration ---
+SOURCE_COLLECTION = settings.collection_name  # real vectors are sampled from here when it has enough points
+BENCH_POINTS = int(os.environ.get("BENCH_POINTS", 20000))  # synthetic points when the source is too small
+BENCH_QUERIES = int(os.environ.get("BENCH_QUERIES", 200))
+BENCH_K = 10
+UPSERT_BATCH = 512
+
+# name -> create_collection options
+LAYOUTS = {
+    "float32 in RAM": {"quantization": "none"},
+    "float32 on disk": {"quantization": "none", "vectors_on_disk": True, "payload_on_disk": True},
+    "scalar int8": {"quantization": "scalar", "vectors_on_disk": True, "payload_on_disk": True},
+    "binary": {"quantization": "binary", "vectors_on_disk": True, "payload_on_disk": True},
+    "scalar int8, m=8": {"quantization": "scalar", "vectors_on_disk": True, "payload_on_disk": True, "hnsw_m": 8},
+}
+
+
+def load_vectors(client, points: int = BENCH_POINTS, seed: int = 0):
+    """Vectors from the source collection if it holds enough points, otherwise clustered synthetic ones."""
+    if client.collection_exists(SOURCE_COLLECTION) and client.count(SOURCE_COLLECTION).count >= 1000:
+        vectors, offset = [], None
+        while len(vectors) < points:
+            records, offset = client.scroll(SOURCE_COLLECTION, limit=1024, offset=offset, with_vectors=True, with_payload=False)
+            vectors.extend(record.vector for record in records)
+            if offset is None:
+                break
+        print(f"Using {len(vectors)} vectors from {SOURCE_COLLECTION}")
+        return normalize(vectors)
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(points // 50, 1), settings.vector_size))
+    vectors = centers[rng.integers(0, len(centers), points)] + 0.5 * rng.standard_normal((points, settings.vector_size))
+    print(f"Using {points} synthetic vectors")
+    return normalize(vectors)
+
+
+def make_queries(vectors, queries: int = BENCH_QUERIES, seed: int = 1):
+    """Queries near stored vectors, like a student question close to a chunk."""
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), queries)]
+    return normalize(picks + 0.3 * rng.standard_normal(picks.shape) / np.sqrt(settings.vector_size))
+
+
+def exact_top_k(vectors, queries, k: int = BENCH_K):
+    scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def _wait_until_indexed(client, collection_name, timeout: float = 600):
+    deadline = time.monotonic() + timeout
+    while client.get_collection(collection_name).status != CollectionStatus.GREEN:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{collection_name} was not indexed within {timeout}s")
+        time.sleep(0.5)
+
+
+def bench_layout(client, name, options, vectors, queries, truth, k: int = BENCH_K):
+    """Load vectors into a scratch collection with the given layout and measure recall and latency."""
+    collection_name = f"bench_{uuid.uuid4().hex[:8]}"
+    # Low indexing threshold so the HNSW graph is built even for small benchmarks
+    create_collection(client, collection_name, optimizers_config=OptimizersConfigDiff(indexing_threshold=1000), **options)
+    try:
+        started = time.perf_counter()
+        for start in range(0, len(vectors), UPSERT_BATCH):
+            batch = vectors[start:start + UPSERT_BATCH]
+            client.upsert(
+                collection_name=collection_name,
+                points=[PointStruct(id=start + i, vector=vector.tolist()) for i, vector in enumerate(batch)],
+            )
+        _wait_until_indexed(client, collection_name)
+        load_seconds = time.perf_counter() - started
+
+        params = search_params(options.get("quantization", "none"))
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            response = client.query_points(collection_name=collection_name, query=query.tolist(), limit=k, search_params=params)
+            latencies.append(time.perf_counter() - started)
+            hits += len({point.id for point in response.points} & set(expected.tolist()))
+    finally:
+        client.delete_collection(collection_name)
+
+    memory = estimate_memory(len(vectors), **options)
+    latencies = np.array(latencies) * 1000
+    return {
+        "layout": name,
+        "ram_mb": memory["total"] / 2 ** 20,
+        "recall": hits / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "load_s": load_seconds,
+    }
+
+
+def run_benchmark(layouts=LAYOUTS):
+    client = get_client()
+    vectors = load_vectors(client)
+    queries = make_queries(vectors)
+    truth = exact_top_k(vectors, queries)
+
+    print(f"{'layout':<20} {'est. RAM':>10} {'recall@' + str(BENCH_K):>10} {'p50':>8} {'p95':>8} {'load':>8}")
+    results = []
+    for name, options in layouts.items():
+        result = bench_layout(client, name, options, vectors, queries, truth)
+        results.append(result)
+        print(f"{name:<20} {result['ram_mb']:>8.1f}MB {result['recall']:>10.3f} {result['p50_ms']:>6.2f}ms {result['p95_ms']:>6.2f}ms {result['load_s']:>7.1f}s")
+    return results
+
+
+if __name__ == "__main__":
+    run_benchmark()
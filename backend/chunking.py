@@ -0,0 +1,132 @@
+import re
+from collections import deque
+
+# --- Configuration ---
+EMBED_CONTEXT_TOKENS = 2048  # nomic-embed-text context window in Ollama
+CHUNK_TOKENS = 256  # target tokens per chunk
+CHUNK_OVERLAP_TOKENS = 32  # tokens of trailing sentences repeated at the start of the next chunk
+TOKEN_SAFETY = 0.75  # count_tokens() undercounts subword tokens, so keep this share of the context
+LONG_WORD_CHARS = 20  # longer runs (URLs, base64, text extracted without spaces) are counted by length
+CHARS_PER_TOKEN = 3  # characters per subword token in such runs, rounded up
+
+CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+# CJK characters are tokenized one by one, other words as a whole, punctuation marks one by one
+TOKEN_PATTERN = re.compile(rf"[{CJK}]|[^\W{CJK}]+|[^\w\s]")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n\s*")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count: words, CJK characters and punctuation marks, with long words counted by length."""
+    tokens = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        length = match.end() - match.start()
+        tokens += 1 if length <= LONG_WORD_CHARS else -(-length // CHARS_PER_TOKEN)
+    return tokens
+
+
+def _split_long_word(word: str, max_tokens: int):
+    """Yield (piece, tokens) slices of a word exceeding max_tokens, e.g. CJK text or a long URL, cut anywhere."""
+    start = 0
+    while start < len(word):
+        length = max_tokens * CHARS_PER_TOKEN
+        piece = word[start:start + length]
+        tokens = count_tokens(piece)
+        while tokens > max_tokens:
+            # A character is at most one token, so this ends with a piece that fits
+            length = max(length * max_tokens // tokens, 1)
+            piece = word[start:start + length]
+            tokens = count_tokens(piece)
+        yield piece, tokens
+        start += len(piece)
+
+
+def iter_sentences(blocks, max_chars: int = 20_000):
+    """
+    Yield (sentence, ends_paragraph) from text arriving in consecutive blocks.
+    The unfinished sentence at the end of a block is carried into the next one;
+    a carry longer than max_chars is flushed as is so pathological input without
+    punctuation stays linear.
+    """
+    carry = ""
+    for block in blocks:
+        text = carry + block
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(text):
+            if match.end() == len(text):
+                break  # the boundary may continue in the next block
+            yield text[start:match.start()], match.group().count("\n") >= 2
+            start = match.end()
+        carry = text[start:]
+        if len(carry) > max_chars:
+            yield carry, False
+            carry = ""
+    if carry.strip():
+        yield carry, True
+
+
+def _split_long_sentence(sentence: str, max_tokens: int):
+    """
+    Yield (piece, tokens) pieces of a sentence, breaking between words only
+    when it exceeds max_tokens; words that do not fit on their own are cut.
+    """
+    tokens = count_tokens(sentence)
+    if tokens <= max_tokens:
+        yield sentence, tokens
+        return
+
+    words, piece_tokens = [], 0
+    for word in sentence.split(" "):
+        word_tokens = count_tokens(word)
+        parts = _split_long_word(word, max_tokens) if word_tokens > max_tokens else [(word, word_tokens)]
+        for part, part_tokens in parts:
+            if words and piece_tokens + part_tokens > max_tokens:
+                yield " ".join(words), piece_tokens
+                words, piece_tokens = [], 0
+            words.append(part)
+            piece_tokens += part_tokens
+    if words:
+        yield " ".join(words), piece_tokens
+
+
+def _join(window):
+    parts = []
+    for sentence, _, ends_paragraph in window:
+        parts.append(sentence)
+        parts.append("\n" if ends_paragraph else " ")
+    return "".join(parts[:-1])
+
+
+def iter_token_chunks(blocks, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+    """
+    Split text arriving in consecutive blocks into chunks of at most max_tokens,
+    breaking on sentence and paragraph boundaries. Each chunk starts with the
+    trailing sentences (up to overlap_tokens) of the previous one.
+
+    Runs as a single streaming pass: every sentence is tokenized once and only
+    the current chunk is buffered.
+    """
+    max_tokens = min(max_tokens, int(EMBED_CONTEXT_TOKENS * TOKEN_SAFETY))
+    window = deque()  # (sentence, tokens, ends_paragraph)
+    window_tokens = 0
+    pending = False  # window holds sentences not emitted yet
+
+    for sentence, ends_paragraph in iter_sentences(blocks):
+        sentence = " ".join(sentence.split())
+        if not sentence:
+            continue
+        pieces = list(_split_long_sentence(sentence, max_tokens))
+        for i, (piece, tokens) in enumerate(pieces):
+            if pending and window_tokens + tokens > max_tokens:
+                yield _join(window)
+                pending = False
+                while window and window_tokens > overlap_tokens:
+                    window_tokens -= window.popleft()[1]
+            # Drop overlap that would not leave room for this piece
+            while window and window_tokens + tokens > max_tokens:
+                window_tokens -= window.popleft()[1]
+            window.append((piece, tokens, ends_paragraph and i == len(pieces) - 1))
+            window_tokens += tokens
+            pending = True
+
+    if pending:
+        yield _join(window)
@@ -1,34 +1,21 @@
-import asyncio
 from pathlib import Path
-import shutil
-import zipfile
 import uuid
-import random
 
-from digesting import digest_directory
-from vectorizer import add_chunks_to_qdrant
-from ollama import chat
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams, Distance
+from graph import get_neighbors, get_random_node, warm_neighbor_cache
+from contextlib import nullcontext
+
+from config import settings
+from manifest import ingest_course
+from metrics import metrics, profile
+from registry import allocate_upload, finish_upload, start_upload, update_upload
+from search import SEARCH_MODE, SEARCH_MODES, search
+from socratic import QuestionPrefetcher
+from store import client
+from vectorizer import add_chunks_to_qdrant, run
 
 # --- Configuration ---
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-fileCounter = 0
-
-QDRANT_HOST = "localhost"
-QDRANT_PORT = 6333
-COLLECTION_NAME = "knowledge"  # Use the same collection as in vectorizer.py
-OLLAMA_MODEL = "gemma3:4b"  # Socratic chat model
-
-# --- Qdrant client ---
-client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-
-if not client.collection_exists(COLLECTION_NAME):
-    client.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=VectorParams(size=768, distance=Distance.COSINE)
-    )
+COLLECTION_NAME = settings.collection_name  # Use the same collection as in vectorizer.py
+OLLAMA_MODEL = settings.chat_model  # Socratic chat model
 
 # --- Utilities ---
 def get_random_node_from_db():
@@ -36,71 +23,43 @@ def get_random_node_from_db():
     Pick a random node from Qdrant and return its payload.
     Raises an error if collection is empty.
     """
-    all_points = []
-    scroll_limit = 1000
-    next_page = None
-
-    while True:
-        points, next_page = client.scroll(
-            collection_name=COLLECTION_NAME,
-            limit=scroll_limit,
-            offset=0 if next_page is None else next_page
-        )
-        all_points.extend(points)
-        if not next_page:  # reached the end
-            break
-
-    if not all_points:
-        raise ValueError("Qdrant collection is empty. Add nodes first.")
-
-    # pick a random point
-    random_point = random.choice(all_points)
-
-    # Make sure payload contains 'neighbors'
-    neighbors = random_point.payload.get("neighbors", [])
-    node = random_point.payload.get("node", "Unnamed Node")
-
-    return node, neighbors
-
-def socratic_question(node, neighbors):
-    """Generate a Socratic question for the node using Ollama."""
-    prompt = f"""
-You are a teacher using the Socratic method.
-Your goal is to ask guiding questions to help the learner understand the topic.
-
-Current node: {node}
-Neighbors: {neighbors}
-
-Ask one guiding question to help the student explore this node and its neighbors.
-"""
-    response = chat(model=OLLAMA_MODEL, messages=[{"role": "user", "content": prompt}])
-    return response.message.content
-
-async def process_course(file_path: Path):
-    """Upload a course zip file and add its chunks to Qdrant."""
-    global fileCounter
+    return get_random_node(client, COLLECTION_NAME)
 
+async def process_course(file_path: Path, incremental: bool = False, profiled: bool = False):
+    """
+    Upload a course zip file and add its chunks to Qdrant.
+    With incremental=True, only files changed since the last upload of the same course are processed.
+    With profiled=True, the upload is captured with cProfile.
+    """
     if not file_path.exists() or file_path.suffix != ".zip":
         print("Error: Only existing .zip files are allowed")
         return
 
+    upload_id = allocate_upload(file_path.name, source="cli")
+    update_upload(upload_id, bytes=file_path.stat().st_size)
+    start_upload(upload_id)
+    progress = {"files_parsed": 0, "chunks_embedded": 0, "points_upserted": 0}
+    payload = {"course": file_path.stem, "upload_id": upload_id}
 
+    # Read the zip in place: no copy into uploads/ and no extraction to disk
+    try:
+        with profile(f"upload_{upload_id}") if profiled else nullcontext():
+            summary = await ingest_course(
+                file_path, course=file_path.stem, incremental=incremental,
+                chunk_pdf_by_page=True, progress=progress, payload=payload,
+            )
+            chunk_count = summary["chunks_added"]
+            if incremental:
+                print(f"Incremental update: {summary}")
+            else:
+                print(f"Extracted {chunk_count} chunks from uploaded course.")
+    except Exception as e:
+        finish_upload(upload_id, file_count=progress["files_parsed"], chunk_count=progress["points_upserted"], error=repr(e))
+        raise
 
-    temp_path = UPLOAD_DIR / f"{fileCounter}.zip"
-    shutil.copy(file_path, temp_path)
-
-    target_dir = UPLOAD_DIR / str(fileCounter)
-    target_dir.mkdir(parents=True, exist_ok=True)
-    with zipfile.ZipFile(temp_path, "r") as zip_ref:
-        zip_ref.extractall(target_dir)
-    temp_path.unlink()
-
-    chunks = digest_directory(target_dir, chunk_pdf_by_page=True)
-    print(f"Extracted {len(chunks)} chunks from uploaded course.")
-
-    await add_chunks_to_qdrant(chunks)
-    fileCounter += 1
-    print(f"Upload complete. Upload ID: {fileCounter - 1}")
+    finish_upload(upload_id, file_count=progress["files_parsed"], chunk_count=chunk_count)
+    print(f"Upload complete. Upload ID: {upload_id}")
+    print(metrics.summary())
 
 async def test_upload():
     """Upload dummy chunks for testing."""
@@ -112,6 +71,17 @@ async def test_upload():
     await add_chunks_to_qdrant(dummy_chunks)
     print(f"Dummy chunks uploaded. Total: {len(dummy_chunks)}")
 
+async def search_courses(query: str, course: str = None, mode: str = SEARCH_MODE):
+    """Print the course chunks best matching a query, best first."""
+    results = await search(query, course=course, mode=mode)
+    if not results:
+        print("No matching chunks. Upload some courses first.")
+        return
+    for rank, hit in enumerate(results, 1):
+        source = f" [{hit['course']}]" if hit["course"] else ""
+        print(f"\n{rank}. {hit['score']:.3f}{source} {hit['node']}")
+        print(hit["text"][:300])
+
 def explore_graph():
     """Interactive Socratic graph exploration from Qdrant nodes."""
     try:
@@ -119,29 +89,38 @@ def explore_graph():
     except ValueError:
         print("No nodes in Qdrant. Upload some courses first.")
         return
+    # The next hop is one of these, so their adjacency is read up front
+    warm_neighbor_cache(COLLECTION_NAME, neighbors)
 
-    while True:
-        question = socratic_question(current_node, neighbors)
-        print("\nTeacher (Socratic):", question)
-
-        if neighbors:
-            print("\nAvailable neighbors:", neighbors)
-            next_node = input("Enter a neighbor to explore (or 'quit' to exit): ").strip()
-            if next_node.lower() == "quit":
-                print("Exiting exploration.")
-                break
-            elif next_node in neighbors:
-                current_node = next_node
-                points, _ = client.scroll(collection_name=COLLECTION_NAME, limit=1000)
-                for p in points:
-                    if p.payload["node"] == current_node:
-                        neighbors = p.payload["neighbors"]
-                        break
+    prefetcher = QuestionPrefetcher(
+        neighbors_of=lambda node: get_neighbors(client, COLLECTION_NAME, node),
+        model=OLLAMA_MODEL,
+    )
+    try:
+        while True:
+            print("\nTeacher (Socratic): ", end="", flush=True)
+            for token in prefetcher.stream(current_node, neighbors):
+                print(token, end="", flush=True)
+            print()
+
+            if neighbors:
+                # Generate questions for likely next nodes while the learner reads
+                prefetcher.prefetch(neighbors)
+                print("\nAvailable neighbors:", neighbors)
+                next_node = input("Enter a neighbor to explore (or 'quit' to exit): ").strip()
+                if next_node.lower() == "quit":
+                    print("Exiting exploration.")
+                    break
+                elif next_node in neighbors:
+                    current_node = next_node
+                    neighbors = get_neighbors(client, COLLECTION_NAME, current_node)
+                else:
+                    print("Invalid neighbor. Try again.")
             else:
-                print("Invalid neighbor. Try again.")
-        else:
-            print("No neighbors to explore. Exploration ends here.")
-            break
+                print("No neighbors to explore. Exploration ends here.")
+                break
+    finally:
+        prefetcher.close()
 
 # --- Interactive CLI ---
 def main():
@@ -150,18 +129,32 @@ def main():
         print("1. Upload course (.zip)")
         print("2. Test upload dummy chunks")
         print("3. Explore nodes interactively")
-        print("4. Quit")
+        print("4. Search course content")
+        print("5. Show performance metrics")
+        print("6. Quit")
 
         choice = input("Select an option: ").strip()
 
         if choice == "1":
             path_str = input("Enter path to .zip course: ").strip().strip('"')
-            asyncio.run(process_course(Path(path_str)))
+            incremental = input("Only process files changed since the last upload? (y/N): ").strip().lower() == "y"
+            profiled = input("Profile this upload with cProfile? (y/N): ").strip().lower() == "y"
+            run(process_course(Path(path_str), incremental=incremental, profiled=profiled))
         elif choice == "2":
-            asyncio.run(test_upload())
+            run(test_upload())
         elif choice == "3":
             explore_graph()
         elif choice == "4":
+            query = input("Enter a search query: ").strip()
+            course = input("Restrict to course (blank for all): ").strip() or None
+            mode = input(f"Search mode ({'/'.join(SEARCH_MODES)}, blank for {SEARCH_MODE}): ").strip().lower() or SEARCH_MODE
+            if mode not in SEARCH_MODES:
+                print("Invalid search mode.")
+            elif query:
+                run(search_courses(query, course=course, mode=mode))
+        elif choice == "5":
+            print(metrics.summary())
+        elif choice == "6":
             print("Goodbye!")
             break
         else:
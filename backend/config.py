@@ -0,0 +1,62 @@
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+def env_flag(name, default=False):
+    return os.environ.get(name, str(int(default))).lower() in ("1", "true", "yes")
+
+
+def _env(name, default, cast=str):
+    return field(default_factory=lambda: cast(os.environ.get(name, default)))
+
+
+def _flag(name, default=False):
+    return field(default_factory=lambda: env_flag(name, default))
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Backend settings shared by the API, the CLI and the job workers, read from
+    the environment once. Reading them never connects to anything; clients
+    are created on first use (see store.get_client).
+    """
+
+    # Qdrant connection
+    qdrant_location: str = _env("QDRANT_LOCATION", "")  # ":memory:" or a path for embedded local mode instead of a server
+    qdrant_host: str = _env("QDRANT_HOST", "localhost")
+    qdrant_port: int = _env("QDRANT_PORT", 6333, int)
+    qdrant_grpc_port: int = _env("QDRANT_GRPC_PORT", 6334, int)
+    qdrant_prefer_grpc: bool = _flag("QDRANT_PREFER_GRPC")  # use gRPC for data calls when the server exposes qdrant_grpc_port
+    qdrant_timeout: int = _env("QDRANT_TIMEOUT", 10, int)  # seconds per request
+
+    # Collection layout
+    collection_name: str = _env("COLLECTION_NAME", "knowledge")  # alias of the live collection version, see reindex.py
+    vector_size: int = _env("VECTOR_SIZE", 768, int)  # dimension for nomic-embed-text
+    quantization: str = _env("QDRANT_QUANTIZATION", "none")  # none, scalar (int8, 4x smaller) or binary (32x smaller)
+    vectors_on_disk: bool = _flag("QDRANT_VECTORS_ON_DISK")  # keep original float32 vectors on disk (mmap)
+    payload_on_disk: bool = _flag("QDRANT_PAYLOAD_ON_DISK")  # keep chunk text on disk instead of RAM
+    hnsw_m: int = _env("QDRANT_HNSW_M", 16, int)  # edges per HNSW node; lower saves RAM, costs recall
+    hnsw_ef_construct: int = _env("QDRANT_HNSW_EF_CONSTRUCT", 100, int)  # build-time beam width
+    hnsw_on_disk: bool = _flag("QDRANT_HNSW_ON_DISK")  # keep the HNSW graph on disk
+    search_hnsw_ef: int = _env("QDRANT_SEARCH_HNSW_EF", 128, int)  # query-time beam width
+    rescore_oversampling: float = _env("QDRANT_RESCORE_OVERSAMPLING", 2.0, float)  # candidates rescored with full vectors, per result
+
+    # Ollama models
+    embedding_model: str = _env("EMBEDDING_MODEL", "nomic-embed-text:latest")
+    chat_model: str = _env("CHAT_MODEL", "gemma3:4b")  # Socratic chat model
+
+    # Retrieval
+    search_mode: str = _env("SEARCH_MODE", "hybrid")  # default mode of search.search: hybrid, vector or lexical
+
+    # Local state
+    upload_dir: Path = _env("UPLOAD_DIR", "uploads", Path)
+    lexical_index_path: Path = _env("LEXICAL_INDEX_PATH", "", lambda value: Path(value) if value else None)  # BM25 index, <upload_dir>/lexical.sqlite3 by default
+
+    def __post_init__(self):
+        if self.lexical_index_path is None:
+            object.__setattr__(self, "lexical_index_path", self.upload_dir / "lexical.sqlite3")
+
+
+settings = Settings()
@@ -1,66 +1,378 @@
-from pathlib import Path
-import fitz
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import groupby
+from pathlib import Path, PurePosixPath
+import io
+import multiprocessing
 import os
+import tempfile
+import time
+import zipfile
 
+from chunking import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, iter_token_chunks
+from metrics import captured, metrics, span
 
-def extract_text_from_file(file_path: Path, chunk_by_page: bool = False):
+# --- Configuration ---
+PAGES_PER_TASK = 32  # PDFs longer than this are split into page ranges across workers
+TEXT_BLOCK_SIZE = 1 << 20  # characters read at a time from text files
+MAX_ZIP_MEMBERS = int(os.environ.get("MAX_ZIP_MEMBERS", 10_000))
+MAX_MEMBER_BYTES = int(os.environ.get("MAX_MEMBER_BYTES", 256 * 1024 * 1024))  # uncompressed, per file
+MAX_ZIP_BYTES = int(os.environ.get("MAX_ZIP_BYTES", 4 * 1024 * 1024 * 1024))  # uncompressed, whole archive
+
+
+class ZipMember:
+    """A file inside a zip archive, read in place instead of being extracted to disk."""
+
+    def __init__(self, zip_path: Path, name: str):
+        self.zip_path = Path(zip_path)
+        self.name = name
+
+    @property
+    def suffix(self):
+        return PurePosixPath(self.name).suffix
+
+    @contextmanager
+    def open(self):
+        with zipfile.ZipFile(self.zip_path) as archive, archive.open(self.name) as member:
+            yield member
+
+    def read_bytes(self):
+        with self.open() as member:
+            return member.read()
+
+    def __eq__(self, other):
+        return isinstance(other, ZipMember) and (self.zip_path, self.name) == (other.zip_path, other.name)
+
+    def __hash__(self):
+        return hash((self.zip_path, self.name))
+
+    def __str__(self):
+        return f"{self.zip_path}!{self.name}"
+
+    __repr__ = __str__
+
+
+def iter_zip_members(zip_path: Path):
     """
-    Extract text from a file. Supports .txt and .pdf.
-    If chunk_by_page is True for PDFs, each page is returned as a separate chunk.
+    Yield the files inside a zip as ZipMembers, sorted by name.
+    Raises ValueError if the archive has too many members or is too large
+    uncompressed; single members above MAX_MEMBER_BYTES are skipped.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        infos = [info for info in archive.infolist() if not info.is_dir()]
+
+    if len(infos) > MAX_ZIP_MEMBERS:
+        raise ValueError(f"Zip has {len(infos)} files, the limit is {MAX_ZIP_MEMBERS}")
+    total_size = sum(info.file_size for info in infos)
+    if total_size > MAX_ZIP_BYTES:
+        raise ValueError(f"Zip expands to {total_size} bytes, the limit is {MAX_ZIP_BYTES}")
+
+    for info in sorted(infos, key=lambda info: info.filename):
+        if info.file_size > MAX_MEMBER_BYTES:
+            print(f"Skipping {info.filename}: {info.file_size} bytes exceeds the {MAX_MEMBER_BYTES} byte limit")
+            continue
+        yield ZipMember(zip_path, info.filename)
+
+
+@contextmanager
+def open_document(file_path):
+    """Open a file on disk or a ZipMember for binary reading."""
+    if isinstance(file_path, ZipMember):
+        with file_path.open() as f:
+            yield f
+    else:
+        with open(file_path, "rb") as f:
+            yield f
+
+
+def _open_pdf(file_path):
+    import fitz
+
+    if isinstance(file_path, ZipMember):
+        with span("zip_read"):
+            data = file_path.read_bytes()
+        return fitz.open(stream=data, filetype="pdf")
+    return fitz.open(file_path)
+
+
+def _iter_text_blocks(file_path, block_size: int = TEXT_BLOCK_SIZE):
+    """Decode a UTF-8 text file incrementally, block_size characters at a time."""
+    with open_document(file_path) as raw, io.TextIOWrapper(raw, encoding="utf-8") as reader:
+        while True:
+            block = reader.read(block_size)
+            if not block:
+                break
+            yield block
+
+
+def iter_text_from_file(file_path: Path, chunk_by_page: bool = False):
+    """
+    Lazily extract text from a file on disk or a ZipMember. Supports .txt and .pdf.
+    If chunk_by_page is True for PDFs, each page is yielded as a separate chunk,
+    so only one page is held in memory at a time. Text files are yielded in
+    consecutive blocks.
     """
     if file_path.suffix.lower() == ".txt":
-        return [file_path.read_text(encoding="utf-8")]
+        yield from _iter_text_blocks(file_path)
 
     elif file_path.suffix.lower() == ".pdf":
-        chunks = []
-        with fitz.open(file_path) as pdf:
-            for page in pdf:
-                page_text = page.get_text()
-                if chunk_by_page:
-                    chunks.append(page_text)
-                else:
-                    chunks.append(page_text)  # Will be concatenated later if needed
-        if not chunk_by_page:
-            return ["".join(chunks)]
-        return chunks
+        with _open_pdf(file_path) as pdf:
+            if chunk_by_page:
+                for page in pdf:
+                    with span("pdf_parse"):
+                        text = page.get_text()
+                    yield text
+            else:
+                with span("pdf_parse", items=pdf.page_count):
+                    text = "".join(page.get_text() for page in pdf)
+                yield text
 
     else:
         print(f"Unsupported file type: {file_path.suffix}")
-        return []
 
 
-def split_text_into_chunks(text: str, chunk_size: int = 100, overlap: int = 10):
+def _count_pages(file_path):
+    """Page count of a PDF, and its bytes if it was read from a zip (None for files on disk)."""
+    import fitz
+
+    if isinstance(file_path, ZipMember):
+        with span("zip_read"):
+            data = file_path.read_bytes()
+        with fitz.open(stream=data, filetype="pdf") as pdf:
+            return pdf.page_count, data
+    with fitz.open(file_path) as pdf:
+        return pdf.page_count, None
+
+
+def _spill(data: bytes, suffix: str):
+    """Write a zip member's bytes to a temporary file, so workers can open page ranges of it by path."""
+    dst = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        with dst:
+            dst.write(data)
+    except BaseException:
+        Path(dst.name).unlink(missing_ok=True)
+        raise
+    return Path(dst.name)
+
+
+def _plan_extraction_tasks(files, pages_per_task: int = PAGES_PER_TASK):
+    """
+    Yield (file_path, source, start, stop, is_last) extraction tasks in file
+    order, where source is the path workers open. PDFs longer than
+    pages_per_task are split into page ranges; if such a PDF is inside a zip,
+    its bytes are first written to a temporary source file, which the caller
+    deletes after its last range. Other files are a single task with no range,
+    read in place.
+    """
+    for file_path in files:
+        if file_path.suffix.lower() != ".pdf":
+            yield file_path, file_path, None, None, True
+            continue
+        page_count, data = _count_pages(file_path)
+        if page_count <= pages_per_task:
+            yield file_path, file_path, None, None, True
+            continue
+        source = file_path if data is None else _spill(data, file_path.suffix)
+        data = None
+        for start in range(0, page_count, pages_per_task):
+            stop = min(start + pages_per_task, page_count)
+            yield file_path, source, start, stop, stop == page_count
+
+
+def _extract_task(file_path: Path, start: int, stop: int, chunk_by_page: bool):
     """
-    Split text into smaller chunks for processing.
+    Run one extraction task in a worker process.
+    Returns the extracted texts, the time spent parsing and the metrics
+    observations recorded meanwhile, to be merged into the parent's metrics.
     """
-    chunks = []
-    start = 0
+    started = time.perf_counter()
+    with captured() as observations:
+        if start is None:
+            texts = list(iter_text_from_file(file_path, chunk_by_page=chunk_by_page))
+        else:
+            with _open_pdf(file_path) as pdf, span("pdf_parse", items=stop - start):
+                texts = [pdf[number].get_text() for number in range(start, stop)]
+    return texts, time.perf_counter() - started, observations
 
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += chunk_size - overlap
 
-    return chunks
+def _iter_extracted_texts_serial(files, chunk_by_page: bool):
+    for file_path in files:
+        print(f"Processing file: {file_path}")
+        started = time.perf_counter()
+        for text in iter_text_from_file(file_path, chunk_by_page=chunk_by_page):
+            yield file_path, text
+        print(f"Processing file done: {file_path} ({time.perf_counter() - started:.2f}s)")
 
 
-def digest_directory(directory: Path, chunk_pdf_by_page: bool = True, text_chunk_size: int = 500, text_overlap: int = 25):
+def iter_extracted_texts(files, chunk_by_page: bool = False, workers: int = None, pages_per_task: int = PAGES_PER_TASK):
+    """
+    Extract text from each file and yield (file_path, text) pairs.
+
+    With workers > 1, files and page ranges of large PDFs are fanned out across a
+    process pool. Results are still yielded in file and page order, and at most
+    2 * workers tasks are in flight so memory stays bounded.
+    """
+    if not workers or workers <= 1:
+        yield from _iter_extracted_texts_serial(files, chunk_by_page)
+        return
+
+    # Forking a multi-threaded server or job worker can copy a lock held by another thread into the child
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    tasks = _plan_extraction_tasks(files, pages_per_task=pages_per_task)
+    pending = deque()
+    spilled = set()
+
+    def submit_next():
+        task = next(tasks, None)
+        if task is None:
+            return False
+        file_path, source, start, stop, _ = task
+        if source != file_path:
+            spilled.add(source)
+        future = pool.submit(_extract_task, source, start, stop, chunk_by_page)
+        pending.append((task, time.perf_counter(), future))
+        return True
+
+    try:
+        while len(pending) < 2 * workers and submit_next():
+            pass
+
+        pages, parse_time, started = [], 0.0, None
+        while pending:
+            (file_path, source, start, stop, is_last), submitted, future = pending.popleft()
+            submit_next()
+            texts, elapsed, observations = future.result()
+            metrics.merge(observations)
+
+            if started is None:
+                print(f"Processing file: {file_path}")
+                started = submitted
+            parse_time += elapsed
+
+            # Whole-document PDFs are joined once their last page range arrives
+            if start is not None and not chunk_by_page:
+                pages.extend(texts)
+            else:
+                for text in texts:
+                    yield file_path, text
+
+            if is_last:
+                if start is not None and not chunk_by_page:
+                    yield file_path, "".join(pages)
+                print(f"Processing file done: {file_path} ({time.perf_counter() - started:.2f}s, {parse_time:.2f}s parsing)")
+                pages, parse_time, started = [], 0.0, None
+                if source in spilled:
+                    spilled.discard(source)
+                    source.unlink()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        for source in spilled:
+            source.unlink(missing_ok=True)
+
+
+def iter_directory_files(directory: Path):
+    """
+    Recursively yield all files in a directory in a stable, sorted order.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            yield Path(root) / name
+
+
+def _timed_token_chunks(blocks, chunk_tokens: int, overlap_tokens: int):
+    """
+    iter_token_chunks, recording the time spent chunking one stream as the
+    `chunking` stage. Time spent waiting for extracted blocks is not counted.
+    """
+    waited = 0.0
+
+    def timed_blocks():
+        nonlocal waited
+        blocks_iter = iter(blocks)
+        while True:
+            started = time.perf_counter()
+            block = next(blocks_iter, None)
+            waited += time.perf_counter() - started
+            if block is None:
+                return
+            yield block
+
+    chunks = iter_token_chunks(timed_blocks(), max_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
+    elapsed, count = 0.0, 0
+    while True:
+        started = time.perf_counter()
+        chunk = next(chunks, None)
+        elapsed += time.perf_counter() - started
+        if chunk is None:
+            break
+        count += 1
+        yield chunk
+    metrics.record("chunking", elapsed - waited, items=count)
+
+
+def iter_file_chunks(files, chunk_pdf_by_page: bool = True, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS, workers: int = None):
+    """
+    Extract text from the given files and yield (file_path, chunk) pairs as
+    they are produced. Text is split on sentence boundaries into chunks of at
+    most chunk_tokens (see chunking.iter_token_chunks).
+    For PDFs, chunk_pdf_by_page keeps chunks from spanning page boundaries.
+    If workers > 1, extraction runs in a process pool (see iter_extracted_texts).
+    """
+    texts = iter_extracted_texts(files, chunk_by_page=chunk_pdf_by_page, workers=workers)
+    for file_path, file_texts in groupby(texts, key=lambda pair: pair[0]):
+        file_texts = (text for _, text in file_texts)
+        if file_path.suffix.lower() == ".pdf" and chunk_pdf_by_page:
+            streams = ([page] for page in file_texts)
+        else:
+            streams = [file_texts]
+        for stream in streams:
+            for chunk in _timed_token_chunks(stream, chunk_tokens, overlap_tokens):
+                yield file_path, chunk
+
+
+def iter_directory_chunks(directory: Path, chunk_pdf_by_page: bool = True, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS, workers: int = None):
+    """
+    Recursively extract text from all files in a directory and yield
+    (file_path, chunk) pairs as they are produced.
+    """
+    return iter_file_chunks(
+        iter_directory_files(directory),
+        chunk_pdf_by_page=chunk_pdf_by_page,
+        chunk_tokens=chunk_tokens,
+        overlap_tokens=overlap_tokens,
+        workers=workers,
+    )
+
+
+def iter_zip_chunks(zip_path: Path, chunk_pdf_by_page: bool = True, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS, workers: int = None):
+    """
+    Extract text from all files inside a zip without extracting it to disk and
+    yield (ZipMember, chunk) pairs as they are produced.
+    """
+    return iter_file_chunks(
+        iter_zip_members(zip_path),
+        chunk_pdf_by_page=chunk_pdf_by_page,
+        chunk_tokens=chunk_tokens,
+        overlap_tokens=overlap_tokens,
+        workers=workers,
+    )
+
+
+def digest_directory(directory: Path, chunk_pdf_by_page: bool = True, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS, workers: int = None):
     """
     Recursively extract text from all files in a directory and split into chunks.
-    For PDFs, can treat each page as a separate chunk.
-    """
-    all_chunks = []
-    for file_path in directory.rglob("*"):
-        if file_path.is_file():
-            print(f"Processing file: {file_path}")
-            chunks = extract_text_from_file(file_path, chunk_by_page=chunk_pdf_by_page)
-            if chunks:
-                for chunk in chunks:
-                    # Only split further if it's from a txt file or if not chunking PDF by page
-                    if file_path.suffix.lower() == ".txt" or not chunk_pdf_by_page:
-                        all_chunks.extend(split_text_into_chunks(chunk, chunk_size=text_chunk_size, overlap=text_overlap))
-                    else:
-                        all_chunks.append(chunk)
-            print(f"Processing file done: {file_path}")
-    return all_chunks
+    For PDFs, can keep chunks within a single page.
+    """
+    chunks = iter_directory_chunks(
+        directory,
+        chunk_pdf_by_page=chunk_pdf_by_page,
+        chunk_tokens=chunk_tokens,
+        overlap_tokens=overlap_tokens,
+        workers=workers,
+    )
+    return [chunk for _, chunk in chunks]
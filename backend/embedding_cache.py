@@ -0,0 +1,91 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from array import array
+from pathlib import Path
+
+# --- Configuration ---
+CACHE_PATH = Path(os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3"))
+CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 200_000))
+
+
+def normalize_chunk(text: str) -> str:
+    """Collapse whitespace so formatting-only differences share a cache entry."""
+    return " ".join(text.split())
+
+
+def chunk_hash(model: str, text: str) -> str:
+    """Content hash of a chunk for a given embedding model."""
+    return hashlib.sha256(f"{model}\0{normalize_chunk(text)}".encode("utf-8")).hexdigest()
+
+
+def point_id_from_hash(digest: str) -> str:
+    """Deterministic Qdrant point ID (a UUID) derived from a chunk hash."""
+    return str(uuid.UUID(hex=digest[:32]))
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed on chunk_hash(), stored in SQLite.
+    Least recently used entries are evicted once max_entries is exceeded.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        return self._conn
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys that are cached and mark them as used."""
+        keys = list(set(keys))
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            # Stay well below SQLite's bound parameter limit
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part)
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            now = time.time()
+            conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            conn.commit()
+        return found
+
+    def put_many(self, vectors):
+        """Store {key: vector} entries, evicting the least recently used beyond max_entries."""
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in vectors.items()]
+        with self._lock:
+            conn = self._connect()
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            conn.commit()
+
+    def clear(self):
+        """Drop every cached embedding."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM embeddings")
+            conn.commit()
@@ -0,0 +1,376 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+import numpy as np
+
+from caching import LRUCache
+from config import settings
+from knn import knn_graph, normalize
+from metrics import metrics, span
+
+# --- Configuration ---
+NEIGHBOR_CACHE_SIZE = 4096  # nodes kept in the in-process adjacency cache
+NEIGHBOR_CACHE_TTL = 300  # seconds before a cached adjacency list is refetched
+GRAPH_NEIGHBORS = 5  # edges per concept node
+GRAPH_BATCH_SIZE = 256  # payload updates sent per request
+GRAPH_CANDIDATES = 20  # nearest points of an added node that may take it as a neighbor, see update_concept_graph
+GRAPH_APPROXIMATE_ABOVE = 20000  # switch to approximate kNN (recall@5 ~0.99, see knn_graph) for larger collections
+GRAPH_DIR = settings.upload_dir / "graph"  # persisted adjacency lists, one SQLite file per collection
+
+
+# In-process node -> neighbors cache
+neighbor_cache = LRUCache(NEIGHBOR_CACHE_SIZE, ttl=NEIGHBOR_CACHE_TTL)
+# One graph build or update at a time, so concurrent upload jobs never interleave their payload writes
+_graph_lock = threading.Lock()
+
+
+def ensure_node_index(client, collection_name):
+    """
+    Create the keyword payload indexes on `node`, used for neighbor lookups,
+    and on `neighbors`, used to find the nodes pointing at a removed one.
+    """
+    from qdrant_client.http.models import PayloadSchemaType
+
+    for field_name in ("node", "neighbors"):
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=PayloadSchemaType.KEYWORD,
+        )
+
+
+def _random_point(client, collection_name):
+    """
+    Fetch one random point without materializing the collection.
+    Uses Qdrant's random sampling query, falling back to a search with a
+    random vector on servers that predate it.
+    """
+    from qdrant_client.http.exceptions import UnexpectedResponse
+    from qdrant_client.http.models import Sample, SampleQuery
+
+    try:
+        result = client.query_points(
+            collection_name=collection_name,
+            query=SampleQuery(sample=Sample.RANDOM),
+            limit=1,
+            with_payload=True,
+        )
+    except UnexpectedResponse:
+        size = client.get_collection(collection_name).config.params.vectors.size
+        result = client.query_points(
+            collection_name=collection_name,
+            query=[random.gauss(0.0, 1.0) for _ in range(size)],
+            limit=1,
+            with_payload=True,
+        )
+    return result.points[0] if result.points else None
+
+
+def get_random_node(client, collection_name):
+    """
+    Pick a random node from Qdrant and return (node, neighbors).
+    Raises an error if collection is empty.
+    """
+    point = _random_point(client, collection_name)
+    if point is None:
+        raise ValueError("Qdrant collection is empty. Add nodes first.")
+
+    node = point.payload.get("node", "Unnamed Node")
+    neighbors = point.payload.get("neighbors", [])
+    neighbor_cache.put((collection_name, node), neighbors)
+    return node, neighbors
+
+
+def get_neighbors(client, collection_name, node):
+    """
+    Return the neighbors of a node. Served from the adjacency cache when
+    possible, otherwise a single filtered lookup on the `node` payload index.
+    """
+    neighbors = neighbor_cache.get((collection_name, node))
+    if neighbors is not None:
+        return neighbors
+
+    from qdrant_client.http.models import FieldCondition, Filter, MatchValue
+
+    with span("qdrant_scroll"):
+        points, _ = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=Filter(must=[FieldCondition(key="node", match=MatchValue(value=node))]),
+            limit=1,
+            with_payload=["neighbors"],
+            with_vectors=False,
+        )
+    neighbors = points[0].payload.get("neighbors", []) if points else []
+    neighbor_cache.put((collection_name, node), neighbors)
+    return neighbors
+
+
+# --- Concept graph ---
+def node_label(text, point_id):
+    """
+    Human-readable, unique node name for a chunk: its first meaningful line
+    plus a short suffix of the point ID.
+    """
+    title = "Untitled"
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if len(line) >= 3:  # skip page numbers and stray symbols
+            title = line if len(line) <= 60 else line[:57].rstrip() + "..."
+            break
+    return f"{title} #{str(point_id)[:6]}"
+
+
+def _load_graph_inputs(client, collection_name, page_size: int = 1000):
+    """Scroll every point with its vector; returns ids, node labels and a unit-normalized float32 matrix."""
+    ids, labels, blocks = [], [], []
+    offset = None
+    while True:
+        with span("qdrant_scroll") as s:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=["node", "text"],
+                with_vectors=True,
+            )
+            s.items = len(points)
+        for point in points:
+            ids.append(point.id)
+            labels.append(point.payload.get("node") or node_label(point.payload.get("text", ""), point.id))
+        if points:
+            blocks.append(normalize([point.vector for point in points]))
+        if offset is None:
+            break
+
+    matrix = np.concatenate(blocks) if blocks else np.empty((0, 0), dtype=np.float32)
+    return ids, labels, matrix
+
+
+def graph_path(collection_name) -> Path:
+    """Adjacency table of a collection's concept graph, one row per node."""
+    return GRAPH_DIR / f"{collection_name}.sqlite3"
+
+
+def _connect_graph(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS adjacency (node TEXT PRIMARY KEY, neighbors TEXT NOT NULL)")
+    return conn
+
+
+def _migrate_json_graph(collection_name):
+    """Convert a graph persisted by older versions as one JSON file into an adjacency table."""
+    json_path = GRAPH_DIR / f"{collection_name}.json"
+    if not json_path.exists() or graph_path(collection_name).exists():
+        return
+    graph = json.loads(json_path.read_text(encoding="utf-8"))
+    nodes = graph["nodes"]
+    if isinstance(nodes, list):
+        # The oldest files stored neighbors as indices into the node list
+        nodes = {node: [nodes[j] for j in row] for node, row in zip(nodes, graph["neighbors"])}
+    _save_graph(collection_name, nodes)
+    json_path.unlink()
+
+
+def _save_graph(collection_name, graph):
+    """Replace the adjacency table with {node: neighbors}, atomically."""
+    GRAPH_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = graph_path(collection_name).with_suffix(".sqlite3.tmp")
+    tmp_path.unlink(missing_ok=True)
+    with closing(_connect_graph(tmp_path)) as conn:
+        conn.executemany("INSERT INTO adjacency (node, neighbors) VALUES (?, ?)", [(node, json.dumps(adjacent)) for node, adjacent in graph.items()])
+        conn.commit()
+    tmp_path.replace(graph_path(collection_name))
+
+
+def _patch_graph(collection_name, graph, removed_nodes=()):
+    """Write the rows of {node: neighbors} and delete the removed nodes, leaving every other row alone."""
+    with closing(_connect_graph(graph_path(collection_name))) as conn:
+        conn.executemany("DELETE FROM adjacency WHERE node = ?", [(node,) for node in removed_nodes])
+        conn.executemany(
+            "INSERT OR REPLACE INTO adjacency (node, neighbors) VALUES (?, ?)",
+            [(node, json.dumps(adjacent)) for node, adjacent in graph.items()],
+        )
+        conn.commit()
+
+
+def _write_payloads(client, collection_name, updates, batch_size):
+    """Write {point_id: (node, neighbors, neighbor_scores)} back to Qdrant."""
+    from qdrant_client.http.models import SetPayload, SetPayloadOperation
+
+    operations = [
+        SetPayloadOperation(set_payload=SetPayload(
+            payload={"node": node, "neighbors": neighbors, "neighbor_scores": scores},
+            points=[point_id],
+        ))
+        for point_id, (node, neighbors, scores) in updates.items()
+    ]
+    for i in range(0, len(operations), batch_size):
+        client.batch_update_points(collection_name=collection_name, update_operations=operations[i:i + batch_size])
+
+
+def build_concept_graph(client, collection_name, k: int = GRAPH_NEIGHBORS, batch_size: int = GRAPH_BATCH_SIZE, approximate: bool = None):
+    """
+    Materialize the concept graph for a collection: every point becomes a node
+    linked to its k nearest neighbors. The `node` / `neighbors` payloads are
+    written back to Qdrant and the adjacency lists are persisted to GRAPH_DIR.
+    Approximate kNN is used above GRAPH_APPROXIMATE_ABOVE nodes unless
+    `approximate` is given. Returns the number of nodes.
+
+    This loads every vector of the collection; after an upload, use
+    update_concept_graph instead.
+    """
+    with _graph_lock:
+        return _build_concept_graph(client, collection_name, k, batch_size, approximate)
+
+
+def _build_concept_graph(client, collection_name, k, batch_size, approximate):
+    started = time.perf_counter()
+    ids, labels, matrix = _load_graph_inputs(client, collection_name)
+    if approximate is None:
+        approximate = len(ids) > GRAPH_APPROXIMATE_ABOVE
+    neighbors, similarities = knn_graph(matrix, k=k, approximate=approximate)
+
+    updates = {
+        ids[i]: (labels[i], [labels[j] for j in neighbors[i]], [round(float(s), 6) for s in similarities[i]])
+        for i in range(len(ids))
+    }
+    _write_payloads(client, collection_name, updates, batch_size)
+    _save_graph(collection_name, {node: adjacent for node, adjacent, _ in updates.values()})
+
+    neighbor_cache.clear()
+    elapsed = time.perf_counter() - started
+    metrics.record("graph_build", elapsed, items=len(ids))
+    print(f"Built concept graph: {len(ids)} nodes, {neighbors.size} edges in {elapsed:.1f}s")
+    return len(ids)
+
+
+def node_labels(client, collection_name, point_ids, batch_size: int = GRAPH_BATCH_SIZE):
+    """Node labels of the given points, e.g. read before deleting them for update_concept_graph."""
+    point_ids = list(point_ids)
+    labels = []
+    for i in range(0, len(point_ids), batch_size):
+        points = client.retrieve(collection_name=collection_name, ids=point_ids[i:i + batch_size], with_payload=["node"])
+        labels.extend(point.payload["node"] for point in points if point.payload.get("node"))
+    return labels
+
+
+def _nearest(client, collection_name, points, limit):
+    """The `limit` nearest other points of each point (retrieved with its vector), with their graph payloads."""
+    from qdrant_client.http.models import QueryRequest
+
+    requests = [
+        QueryRequest(query=point.vector, limit=limit + 1, with_payload=["node", "neighbors", "neighbor_scores"])
+        for point in points
+    ]
+    with span("qdrant_query", items=len(points)):
+        responses = client.query_batch_points(collection_name=collection_name, requests=requests)
+    return [[hit for hit in response.points if hit.id != point.id][:limit] for point, response in zip(points, responses)]
+
+
+def _iter_points_with_vectors(client, collection_name, point_ids, batch_size):
+    point_ids = list(point_ids)
+    for i in range(0, len(point_ids), batch_size):
+        yield client.retrieve(collection_name=collection_name, ids=point_ids[i:i + batch_size], with_payload=["node"], with_vectors=True)
+
+
+def update_concept_graph(client, collection_name, added_ids=(), removed_nodes=(), k: int = GRAPH_NEIGHBORS, batch_size: int = GRAPH_BATCH_SIZE):
+    """
+    Patch the concept graph after points were added and/or removed, with
+    work proportional to the change rather than the collection:
+    added points get their k nearest neighbors from Qdrant queries, the
+    GRAPH_CANDIDATES points nearest to each added point take it as a
+    neighbor if it beats their current k-th one, and points that linked to a
+    removed node are recomputed. Only points whose neighbor list changed are
+    written back. Falls back to a full build if the graph was never built.
+    Returns the number of nodes updated.
+    """
+    from qdrant_client.http.models import FieldCondition, Filter, MatchAny
+
+    with _graph_lock:
+        _migrate_json_graph(collection_name)
+        if not graph_path(collection_name).exists():
+            return _build_concept_graph(client, collection_name, k, batch_size, None)
+
+        started = time.perf_counter()
+        added = set(str(point_id) for point_id in added_ids)
+        updates = {}  # point id -> (node, neighbors, neighbor_scores)
+        recompute = set()
+
+        for points in _iter_points_with_vectors(client, collection_name, added, batch_size):
+            for point, hits in zip(points, _nearest(client, collection_name, points, max(k, GRAPH_CANDIDATES))):
+                node = point.payload["node"]
+                updates[point.id] = (node, [hit.payload["node"] for hit in hits[:k]], [hit.score for hit in hits[:k]])
+                for hit in hits:
+                    if hit.id in added:
+                        continue
+                    label, adjacent, scores = updates.get(hit.id) or (
+                        hit.payload["node"], hit.payload.get("neighbors", []), hit.payload.get("neighbor_scores"),
+                    )
+                    if scores is None or len(scores) != len(adjacent):
+                        recompute.add(hit.id)  # built before edge scores were stored
+                        continue
+                    if node in adjacent or (len(adjacent) >= k and hit.score <= scores[-1]):
+                        continue
+                    position = sum(score >= hit.score for score in scores)
+                    adjacent = (adjacent[:position] + [node] + adjacent[position:])[:k]
+                    scores = (scores[:position] + [hit.score] + scores[position:])[:k]
+                    updates[hit.id] = (label, adjacent, scores)
+
+        removed_nodes = list(removed_nodes)
+        for i in range(0, len(removed_nodes), batch_size):
+            offset = None
+            condition = Filter(must=[FieldCondition(key="neighbors", match=MatchAny(any=removed_nodes[i:i + batch_size]))])
+            while True:
+                points, offset = client.scroll(
+                    collection_name=collection_name, scroll_filter=condition, limit=batch_size, offset=offset, with_payload=False,
+                )
+                recompute.update(point.id for point in points)
+                if offset is None:
+                    break
+
+        for points in _iter_points_with_vectors(client, collection_name, recompute, batch_size):
+            for point, hits in zip(points, _nearest(client, collection_name, points, k)):
+                updates[point.id] = (point.payload["node"], [hit.payload["node"] for hit in hits], [hit.score for hit in hits])
+
+        _write_payloads(client, collection_name, updates, batch_size)
+        _patch_graph(collection_name, {node: adjacent for node, adjacent, _ in updates.values()}, removed_nodes)
+
+        neighbor_cache.clear()
+        elapsed = time.perf_counter() - started
+        metrics.record("graph_update", elapsed, items=len(updates))
+        print(f"Updated concept graph: {len(added)} added, {len(removed_nodes)} removed, {len(updates)} nodes rewritten in {elapsed:.1f}s")
+        return len(updates)
+
+
+def load_concept_graph(collection_name):
+    """Load the persisted adjacency lists as {node: [neighbor, ...]}, or {} if not built yet."""
+    _migrate_json_graph(collection_name)
+    path = graph_path(collection_name)
+    if not path.exists():
+        return {}
+    with closing(_connect_graph(path)) as conn:
+        return {node: json.loads(adjacent) for node, adjacent in conn.execute("SELECT node, neighbors FROM adjacency")}
+
+
+def warm_neighbor_cache(collection_name, nodes):
+    """
+    Seed the adjacency cache with the neighbors of the given nodes, e.g. the
+    ones reachable from the start node, from the persisted graph, so the
+    next exploration hop skips Qdrant. Returns the number of nodes seeded.
+    """
+    _migrate_json_graph(collection_name)
+    path = graph_path(collection_name)
+    nodes = list(nodes)
+    if not path.exists() or not nodes:
+        return 0
+    with closing(_connect_graph(path)) as conn:
+        placeholders = ",".join("?" * len(nodes))
+        rows = conn.execute(f"SELECT node, neighbors FROM adjacency WHERE node IN ({placeholders})", nodes).fetchall()
+    for node, adjacent in rows:
+        neighbor_cache.put((collection_name, node), json.loads(adjacent))
+    return len(rows)
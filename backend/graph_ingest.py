@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from graphiti_core import Graphiti
+from graphiti_core.cross_encoder import OpenAIRerankerClient
+from graphiti_core.embedder import OpenAIEmbedder, OpenAIEmbedderConfig
+from graphiti_core.llm_client import LLMConfig
+from graphiti_core.llm_client.openai_generic_client import OpenAIGenericClient
+from graphiti_core.nodes import EpisodeType
+
+from config import settings
+from digesting import digest_directory, iter_zip_chunks
+
+load_dotenv()
+
+# --- Configuration ---
+NEO4J_URI = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
+NEO4J_USER = os.environ.get("NEO4J_USER", "neo4j")
+NEO4J_PASSWORD = os.environ.get("NEO4J_PASSWORD", "testpassword")
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://127.0.0.1:11434/v1")  # Ollama's OpenAI-compatible endpoint
+GRAPH_LLM_MODEL = os.environ.get("GRAPH_LLM_MODEL", "deepseek-r1:7b")  # entity extraction model
+EPISODE_CHUNKS = int(os.environ.get("EPISODE_CHUNKS", 4))  # chunks joined into one episode
+EPISODE_CONCURRENCY = int(os.environ.get("EPISODE_CONCURRENCY", 4))  # add_episode calls in flight
+CHECKPOINT_DIR = settings.upload_dir / "graph_checkpoints"  # finished episodes per course, for resuming
+REPORT_INTERVAL = 10  # print throughput every this many episodes
+
+
+def make_graphiti():
+    """Graphiti client backed by Neo4j and the local Ollama models."""
+    llm_config = LLMConfig(
+        api_key="ollama",  # Ollama doesn't require a real API key, but some placeholder is needed
+        model=GRAPH_LLM_MODEL,
+        small_model=GRAPH_LLM_MODEL,
+        base_url=OLLAMA_BASE_URL,
+    )
+    llm_client = OpenAIGenericClient(config=llm_config)
+    return Graphiti(
+        NEO4J_URI,
+        NEO4J_USER,
+        NEO4J_PASSWORD,
+        llm_client=llm_client,
+        embedder=OpenAIEmbedder(
+            config=OpenAIEmbedderConfig(
+                api_key="ollama",
+                embedding_model="nomic-embed-text",
+                embedding_dim=768,
+                base_url=OLLAMA_BASE_URL,
+            )
+        ),
+        cross_encoder=OpenAIRerankerClient(client=llm_client, config=llm_config),
+    )
+
+
+def course_chunks(source: Path):
+    """Chunks of a course directory (via digest_directory) or of a course zip read in place."""
+    source = Path(source)
+    if source.is_dir():
+        return digest_directory(source)
+    return [chunk for _, chunk in iter_zip_chunks(source)]
+
+
+def make_episodes(chunks, chunks_per_episode: int = EPISODE_CHUNKS):
+    """Group consecutive chunks into episode bodies, keeping course order."""
+    return ["\n\n".join(chunks[i:i + chunks_per_episode]) for i in range(0, len(chunks), chunks_per_episode)]
+
+
+def episode_key(body: str) -> str:
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def checkpoint_path(course: str) -> Path:
+    return CHECKPOINT_DIR / f"{course}.json"
+
+
+def load_checkpoint(course: str):
+    """Keys of the episodes already added for a course."""
+    path = checkpoint_path(course)
+    if not path.exists():
+        return set()
+    return set(json.loads(path.read_text(encoding="utf-8"))["done"])
+
+
+def save_checkpoint(course: str, done):
+    CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+    path = checkpoint_path(course)
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps({"course": course, "done": sorted(done)}), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+async def ingest_course_graph(source: Path, course: str = None, concurrency: int = EPISODE_CONCURRENCY, chunks_per_episode: int = EPISODE_CHUNKS):
+    """
+    Turn a course directory or zip into Graphiti episodes, running entity
+    extraction for up to `concurrency` episodes at once. Finished episodes are
+    checkpointed, so a rerun after a crash only adds the remaining ones.
+    Failed episodes are reported and retried on the next run.
+    """
+    source = Path(source)
+    course = course or source.stem
+    group_id = re.sub(r"[^A-Za-z0-9_-]", "_", course)
+
+    episodes = make_episodes(course_chunks(source), chunks_per_episode)
+    done = load_checkpoint(course)
+    pending = [(i, body) for i, body in enumerate(episodes) if episode_key(body) not in done]
+    print(f"Course {course}: {len(episodes)} episodes, {len(episodes) - len(pending)} already in the graph")
+
+    # Episodes keep the course order on the graph's timeline, whatever order they finish in
+    start_time = datetime.now(timezone.utc)
+    semaphore = asyncio.Semaphore(concurrency)
+    checkpoint_lock = asyncio.Lock()
+    added, failed = 0, 0
+    started = time.perf_counter()
+
+    graphiti = make_graphiti()
+
+    async def add(i, body):
+        nonlocal added, failed
+        async with semaphore:
+            try:
+                await graphiti.add_episode(
+                    name=f"{course} {i}",
+                    episode_body=body,
+                    source=EpisodeType.text,
+                    source_description=f"course material: {course}",
+                    reference_time=start_time + timedelta(seconds=i),
+                    group_id=group_id,
+                )
+            except Exception as e:
+                failed += 1
+                print(f"Episode {i} of {course} failed: {e!r}")
+                return
+
+        async with checkpoint_lock:
+            done.add(episode_key(body))
+            await asyncio.to_thread(save_checkpoint, course, done)
+            added += 1
+            if added % REPORT_INTERVAL == 0:
+                minutes = (time.perf_counter() - started) / 60
+                print(f"{added}/{len(pending)} episodes added ({added / minutes:.1f} episodes/min)")
+
+    try:
+        await graphiti.build_indices_and_constraints()
+        await asyncio.gather(*(add(i, body) for i, body in pending))
+    finally:
+        await graphiti.close()
+
+    elapsed = time.perf_counter() - started
+    rate = added / (elapsed / 60) if elapsed else 0.0
+    print(f"Added {added} episodes in {elapsed:.0f}s ({rate:.1f} episodes/min), {failed} failed")
+    return {"episodes": len(episodes), "added": added, "failed": failed, "skipped": len(episodes) - len(pending), "episodes_per_minute": round(rate, 2)}
+
+
+if __name__ == "__main__":
+    path_str = input("Enter path to a course directory or .zip: ").strip().strip('"')
+    asyncio.run(ingest_course_graph(Path(path_str)))
@@ -0,0 +1,244 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from config import settings
+
+# --- Configuration ---
+JOBS_DB = settings.upload_dir / "jobs.sqlite3"
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", 2))  # jobs run at once per process
+POLL_INTERVAL = 1.0  # seconds between checks for jobs enqueued by other processes
+PROGRESS_FLUSH_INTERVAL = 0.5  # seconds between progress writes
+PROGRESS_FIELDS = ("files_parsed", "chunks_embedded", "points_upserted")
+JOB_LEASE = float(os.environ.get("JOB_LEASE", 60))  # seconds a running job stays claimed without a heartbeat
+HEARTBEAT_INTERVAL = JOB_LEASE / 4  # seconds between lease renewals of running jobs
+# Hostnames and PIDs repeat across container restarts, so each process also gets a random suffix
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_handlers = {}
+_exclusive_kinds = set()
+
+
+def register_handler(kind: str, handler, exclusive: bool = False):
+    """
+    Register handler(params, progress) -> result for jobs of the given kind.
+    Exclusive jobs (e.g. reindexing) only start once no other job is running,
+    and no job starts while one of them runs, in any process.
+    """
+    _handlers[kind] = handler
+    if exclusive:
+        _exclusive_kinds.add(kind)
+
+
+def _connect():
+    JOBS_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, status TEXT NOT NULL, "
+        "params TEXT NOT NULL, result TEXT, error TEXT, worker TEXT, "
+        "files_parsed INTEGER NOT NULL DEFAULT 0, chunks_embedded INTEGER NOT NULL DEFAULT 0, "
+        "points_upserted INTEGER NOT NULL DEFAULT 0, "
+        "created_at REAL NOT NULL, started_at REAL, finished_at REAL, lease_expires REAL)"
+    )
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "lease_expires" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires REAL")
+    return conn
+
+
+def enqueue_job(kind: str, params) -> int:
+    """Persist a queued job and return its ID."""
+    with closing(_connect()) as conn:
+        cursor = conn.execute(
+            "INSERT INTO jobs (kind, status, params, created_at) VALUES (?, 'queued', ?, ?)",
+            (kind, json.dumps(params), time.time()),
+        )
+        return cursor.lastrowid
+
+
+def get_job(job_id: int):
+    """Job state, progress and throughput as a dict, or None if there is no such job."""
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    elapsed = None
+    if job["started_at"]:
+        elapsed = (job["finished_at"] or time.time()) - job["started_at"]
+    job["elapsed"] = elapsed
+    job["chunks_per_second"] = job["chunks_embedded"] / elapsed if elapsed else 0.0
+    return job
+
+
+def _claim_next_job():
+    """
+    Atomically move the oldest queued job to running; safe across processes.
+    Jobs are claimed in order, so a queued exclusive job holds back the ones
+    behind it until the running jobs finish.
+    """
+    with closing(_connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _requeue_expired(conn)
+        running = [row["kind"] for row in conn.execute("SELECT kind FROM jobs WHERE status = 'running'")]
+        row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        exclusive_running = any(kind in _exclusive_kinds for kind in running)
+        if row is None or exclusive_running or (running and row["kind"] in _exclusive_kinds):
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, lease_expires = ? WHERE id = ?",
+            (WORKER_ID, time.time(), time.time() + JOB_LEASE, row["id"]),
+        )
+        conn.execute("COMMIT")
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    return job
+
+
+def _finish_job(job_id: int, status: str, result=None, error: str = None):
+    # A job whose lease expired may have been claimed again; its new owner reports the outcome
+    with closing(_connect()) as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_expires = NULL WHERE id = ? AND worker = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, WORKER_ID),
+        )
+
+
+def _requeue_expired(conn):
+    """Requeue running jobs whose worker stopped renewing their lease; call inside a transaction."""
+    rows = conn.execute(
+        "SELECT id FROM jobs WHERE status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)", (time.time(),)
+    ).fetchall()
+    for row in rows:
+        conn.execute("UPDATE jobs SET status = 'queued', worker = NULL, lease_expires = NULL WHERE id = ?", (row["id"],))
+        print(f"Requeued interrupted job {row['id']}")
+
+
+def recover_jobs():
+    """
+    Requeue jobs left running by a worker that stopped renewing their lease,
+    e.g. after a crash, a restart or a replaced container. Workers also do
+    this before claiming a job. Ingestion is idempotent, so rerunning is safe.
+    """
+    with closing(_connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _requeue_expired(conn)
+        conn.execute("COMMIT")
+
+
+def _renew_leases(job_ids):
+    with closing(_connect()) as conn:
+        conn.executemany(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            [(time.time() + JOB_LEASE, job_id, WORKER_ID) for job_id in job_ids],
+        )
+
+
+class JobProgress(dict):
+    """
+    Progress counters of a running job. Plain dict updates such as
+    progress["chunks_embedded"] += n are written to the job store, throttled.
+    """
+
+    def __init__(self, job_id: int):
+        super().__init__({field: 0 for field in PROGRESS_FIELDS})
+        self.job_id = job_id
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if time.monotonic() - self._last_flush >= PROGRESS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            with closing(_connect()) as conn:
+                conn.execute(
+                    "UPDATE jobs SET files_parsed = ?, chunks_embedded = ?, points_upserted = ? WHERE id = ?",
+                    (*(self[field] for field in PROGRESS_FIELDS), self.job_id),
+                )
+
+
+class JobWorkerPool:
+    """Worker threads that claim queued jobs from the job store and run their handlers."""
+
+    def __init__(self, concurrency: int = JOB_CONCURRENCY, poll_interval: float = POLL_INTERVAL):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._running = set()
+
+    def start(self):
+        recover_jobs()
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def notify(self):
+        """Wake idle workers after enqueueing a job."""
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop taking new jobs. Jobs still running are requeued once their lease expires."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = _claim_next_job()
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _heartbeat(self):
+        """Renew the leases of this process's running jobs until stopped."""
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            if self._running:
+                _renew_leases(list(self._running))
+
+    def _run(self, job):
+        self._running.add(job["id"])
+        progress = JobProgress(job["id"])
+        handler = _handlers.get(job["kind"])
+        print(f"Starting job {job['id']} ({job['kind']})")
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind {job['kind']!r}")
+            result = handler(job["params"], progress)
+        except Exception as e:
+            progress.flush()
+            _finish_job(job["id"], "failed", error=repr(e))
+            print(f"Job {job['id']} failed: {e!r}")
+            return
+        finally:
+            self._running.discard(job["id"])
+            # Jobs held back by an exclusive job may be able to start now
+            self._wake.set()
+        progress.flush()
+        _finish_job(job["id"], "done", result=result)
+        print(f"Job {job['id']} done: {result}")
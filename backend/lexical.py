@@ -0,0 +1,157 @@
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+from config import settings
+
+# --- Configuration ---
+LEXICAL_INDEX_PATH = settings.lexical_index_path  # BM25 index of the knowledge collection
+LEXICAL_BATCH_SIZE = 1000  # points read per scroll when rebuilding
+
+TOKEN_PATTERN = re.compile(r"\w+")
+HIT_FIELDS = ("id", "score", "text", "node", "course", "upload_id")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    rowid INTEGER PRIMARY KEY,
+    point_id TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL,
+    node TEXT,
+    course TEXT,
+    upload_id INTEGER
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    text, content='chunks', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_au AFTER UPDATE ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+    INSERT INTO chunks_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+"""
+
+INSERT_SQL = (
+    "INSERT INTO chunks (point_id, text, node, course, upload_id) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (point_id) DO UPDATE SET "
+    "text = excluded.text, node = excluded.node, course = excluded.course, upload_id = excluded.upload_id"
+)
+
+
+def _rows(points):
+    return [
+        (str(point_id), payload["text"], payload.get("node"), payload.get("course"), payload.get("upload_id"))
+        for point_id, payload in points
+    ]
+
+
+def match_expression(query: str):
+    """FTS5 query matching any word of the query, or None if it has no words. Quoting keeps operators and punctuation literal."""
+    terms = dict.fromkeys(token.lower() for token in TOKEN_PATTERN.findall(query))
+    return " OR ".join(f'"{term}"' for term in terms) or None
+
+
+class LexicalIndex:
+    """
+    BM25 keyword index over chunk text, stored in SQLite FTS5 next to the
+    Qdrant collection and keyed on the same point IDs. It is updated as
+    points are added and deleted, and answers exact-term queries (formula
+    names, theorem numbers, acronyms) without embedding them.
+    """
+
+    def __init__(self, path: Path = LEXICAL_INDEX_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def add(self, points):
+        """Index (point_id, payload) pairs; points already indexed are replaced."""
+        rows = _rows(points)
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(INSERT_SQL, rows)
+            conn.commit()
+
+    def delete(self, point_ids):
+        with self._lock:
+            conn = self._connect()
+            conn.executemany("DELETE FROM chunks WHERE point_id = ?", [(str(point_id),) for point_id in point_ids])
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM chunks")
+            conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, query: str, limit: int, course: str = None, upload_id: int = None):
+        """
+        Chunks matching any word of the query ranked by BM25, best first, as
+        hit dicts like search.search returns. Scores are negated bm25() values,
+        so higher is better.
+        """
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        sql = (
+            "SELECT chunks.point_id, -bm25(chunks_fts) AS score, chunks.text, chunks.node, chunks.course, chunks.upload_id "
+            "FROM chunks_fts JOIN chunks ON chunks.rowid = chunks_fts.rowid WHERE chunks_fts MATCH ?"
+        )
+        params = [expression]
+        if course is not None:
+            sql += " AND chunks.course = ?"
+            params.append(course)
+        if upload_id is not None:
+            sql += " AND chunks.upload_id = ?"
+            params.append(upload_id)
+        sql += " ORDER BY bm25(chunks_fts) LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        return [dict(zip(HIT_FIELDS, row)) for row in rows]
+
+    def rebuild(self, client, collection_name):
+        """Replace the index with the points currently in a collection, e.g. after a reindex changed point IDs."""
+        points, offset = [], None
+        while True:
+            batch, offset = client.scroll(
+                collection_name=collection_name, limit=LEXICAL_BATCH_SIZE, offset=offset, with_payload=True, with_vectors=False
+            )
+            points.extend((point.id, point.payload) for point in batch if "text" in point.payload)
+            if offset is None:
+                break
+
+        rows = _rows(points)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM chunks")
+            conn.executemany(INSERT_SQL, rows)
+            conn.commit()
+        return len(rows)
+
+
+lexical_index = LexicalIndex()
+
+
+if __name__ == "__main__":
+    from store import client
+
+    count = lexical_index.rebuild(client, settings.collection_name)
+    print(f"Indexed {count} chunks of {settings.collection_name} in {lexical_index.path}")
@@ -1,20 +1,86 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager, nullcontext
 from pathlib import Path
 import shutil
 import asyncio
+import json
+import threading
+import time
 
 
 
-from digesting import digest_directory
-from vectorizer import add_chunks_to_qdrant
+from graph import get_neighbors
+from jobs import JobWorkerPool, enqueue_job, get_job, register_handler
+from manifest import ingest_course
+from metrics import metrics, profile
+from reindex import reindex
+from registry import UPLOAD_DIR, allocate_upload, finish_upload, get_upload, list_uploads, start_upload, update_upload, upload_zip_path
+from search import SEARCH_LIMIT, SEARCH_MODE, SEARCH_MODES, search
+from socratic import stream_socratic_question
+from store import client_ready, get_collection_client
+from vectorizer import add_chunks_to_qdrant, client, close_clients, run, COLLECTION_NAME
 
-app = FastAPI()
-UPLOAD_DIR = Path("uploads")
+STARTED = time.time()
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-fileCounter = 0
+
+def run_upload_job(params, progress):
+    """
+    Job handler: ingest an uploaded course zip, reading its members in place.
+    With params["profile"], the ingestion is captured with cProfile.
+    """
+    upload_id = params["upload_id"]
+    zip_path = upload_zip_path(upload_id)
+    start_upload(upload_id)
+    payload = {"course": params["course"], "upload_id": upload_id}
+    profiler = profile(f"upload_{upload_id}") if params.get("profile") else nullcontext()
+
+    try:
+        with profiler:
+            # Chunks stream into Qdrant while the course is still being parsed
+            summary = run(ingest_course(
+                zip_path, course=params["course"], incremental=params["incremental"],
+                chunk_pdf_by_page=True, progress=progress, payload=payload,
+            ))
+    except Exception as e:
+        finish_upload(upload_id, file_count=progress["files_parsed"], chunk_count=progress["points_upserted"], error=repr(e))
+        raise
+
+    finish_upload(upload_id, file_count=progress["files_parsed"], chunk_count=summary["chunks_added"])
+    return {"upload_id": upload_id, **summary}
+
+
+def run_reindex_job(params, progress):
+    """Job handler: rebuild the knowledge collection as a new version and switch the alias to it."""
+    return run(reindex(reembed=params["reembed"], drop_previous=params["drop_previous"], progress=progress))
+
+
+register_handler("upload_course", run_upload_job)
+register_handler("reindex", run_reindex_job, exclusive=True)
+job_pool = JobWorkerPool()
 
 
+def warm_up():
+    """Connect to Qdrant and bootstrap the collection in the background, so startup never waits on it."""
+    try:
+        get_collection_client()
+        print("Qdrant client ready")
+    except Exception as e:
+        print(f"Qdrant warm-up failed, retrying on first use: {e!r}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    threading.Thread(target=warm_up, daemon=True).start()
+    job_pool.start()
+    yield
+    job_pool.stop()
+    await close_clients()
+
+
+app = FastAPI(lifespan=lifespan)
+
 
 @app.get("/")
 def read_root():
@@ -22,37 +88,101 @@ def read_root():
 
 
 @app.post("/upload-course/")
-async def upload_course(file: UploadFile = File(...)):
-    global fileCounter
-
+async def upload_course(file: UploadFile = File(...), incremental: bool = False, profile: bool = False):
+    """
+    Queue a course zip for ingestion and return its job ID immediately.
+    With incremental=true, only files that changed since the last upload of
+    the same course (by zip name) are processed. With profile=true, the upload
+    is captured with cProfile. Poll /jobs/{job_id} for progress.
+    """
     if not file.filename.endswith(".zip"):
         return {"error": "Only .zip files are allowed"}
 
-    # Save uploaded file temporarily
-    upload_path = UPLOAD_DIR / f"{fileCounter}.zip"
+    upload_id = allocate_upload(file.filename, source="api")
+
+    # The stored zip is the only copy of the upload; it is read in place, never extracted
+    upload_path = upload_zip_path(upload_id)
     with open(upload_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+        await asyncio.to_thread(shutil.copyfileobj, file.file, buffer)
 
     file.file.close()
+    update_upload(upload_id, bytes=upload_path.stat().st_size)
 
-    # Digest: extract and chunk
-    target_dir = UPLOAD_DIR / str(fileCounter)
-    target_dir.mkdir(parents=True, exist_ok=True)
-    import zipfile
-    with zipfile.ZipFile(upload_path, "r") as zip_ref:
-        zip_ref.extractall(target_dir)
-    upload_path.unlink()  # remove zip
+    job_id = enqueue_job("upload_course", {
+        "upload_id": upload_id,
+        "course": Path(file.filename).stem,
+        "incremental": incremental,
+        "profile": profile,
+    })
+    job_pool.notify()
 
-    chunks = digest_directory(target_dir, chunk_pdf_by_page=True)
+    return {"job_id": job_id, "upload_id": upload_id, "status": "queued"}
 
-    print(f"\n\n\nExtracted {len(chunks)} chunks from uploaded course.\n\n\n\n")
 
-    # Send chunks to Graphiti
-    await add_chunks_to_qdrant(chunks)
+@app.post("/reindex")
+def reindex_collection(reembed: bool = False, drop_previous: bool = False):
+    """
+    Queue a blue/green reindex of the knowledge collection. Searches and uploads
+    keep using the current version until the new one is complete.
+    With reembed=true, chunks are re-embedded with the current model instead of copied.
+    """
+    job_id = enqueue_job("reindex", {"reembed": reembed, "drop_previous": drop_previous})
+    job_pool.notify()
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: int):
+    """Status, progress (files parsed, chunks embedded, points upserted) and throughput of a job."""
+    job = get_job(job_id)
+    if job is None:
+        return {"error": "Job not found"}
+    return job
+
+
+@app.get("/health")
+def health():
+    """Liveness check that answers immediately, without connecting to Qdrant or Ollama."""
+    return {
+        "status": "ok",
+        "uptime_seconds": round(time.time() - STARTED, 1),
+        "qdrant": "ready" if client_ready() else "cold",
+    }
+
+
+@app.get("/metrics")
+def performance_metrics():
+    """Latency histograms and throughput of every instrumented stage since startup."""
+    return metrics.snapshot()
+
 
-    fileCounter += 1
+@app.get("/uploads")
+def uploads(limit: int = 100):
+    """Recent uploads with their file count, chunk count, size and timing."""
+    return list_uploads(limit)
 
-    return {"upload_id": fileCounter - 1, "chunks_added": len(chunks)}
+
+@app.get("/uploads/{upload_id}")
+def upload_status(upload_id: int):
+    upload = get_upload(upload_id)
+    if upload is None:
+        return {"error": "Upload not found"}
+    return upload
+
+
+@app.get("/search")
+async def search_chunks(q: str, limit: int = SEARCH_LIMIT, course: str = None, upload_id: int = None, mode: str = SEARCH_MODE):
+    """
+    Search over uploaded course content.
+    Returns the chunks best matching `q`, best first, optionally filtered by course or upload.
+    mode is hybrid (keywords and meaning, fused), vector (meaning only) or
+    lexical (exact words only, answered without embedding the query).
+    """
+    if not q.strip():
+        return {"error": "Query must not be empty"}
+    if mode not in SEARCH_MODES:
+        return {"error": f"Unknown search mode, expected one of {', '.join(SEARCH_MODES)}"}
+    return {"query": q, "mode": mode, "results": await search(q, limit=limit, course=course, upload_id=upload_id, mode=mode)}
 
 
 @app.get("/test-upload/")
@@ -70,6 +200,28 @@ async def test_upload():
     return {"message": "Dummy chunks uploaded to Graphiti", "chunks_added": len(dummy_chunks)}
 
 
+@app.get("/socratic/stream")
+def socratic_stream(node: str, neighbors: list[str] = Query(None)):
+    """
+    Stream a Socratic question about a node as server-sent events.
+    Each token is sent as a JSON-encoded `data:` line, followed by a `done` event.
+    Neighbors are looked up in Qdrant unless given.
+    """
+    if neighbors is None:
+        neighbors = get_neighbors(client, COLLECTION_NAME, node)
+
+    def events():
+        try:
+            for token in stream_socratic_question(node, neighbors):
+                yield f"data: {json.dumps(token)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+            return
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=8080, reload=True)
@@ -0,0 +1,186 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import settings
+from digesting import iter_directory_files, iter_zip_members, open_document
+from graph import node_labels, update_concept_graph
+from pipeline import ingest_files
+from search import result_cache
+from store import collection_lock
+from vectorizer import client, delete_points, COLLECTION_NAME
+
+# --- Configuration ---
+MANIFEST_DIR = settings.upload_dir / "manifests"
+
+
+def hash_file(file_path) -> str:
+    """SHA-256 of a file's contents (on disk or a ZipMember), read in blocks."""
+    digest = hashlib.sha256()
+    with open_document(file_path) as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path(course: str) -> Path:
+    return MANIFEST_DIR / f"{course}.json"
+
+
+@contextmanager
+def course_lock(course: str):
+    """
+    Hold an exclusive lock on a course's manifest, across threads and processes.
+    Uploads of the same course run one at a time from load_manifest to
+    save_manifest, so none of them saves a manifest based on a stale one.
+    """
+    MANIFEST_DIR.mkdir(parents=True, exist_ok=True)
+    with open(MANIFEST_DIR / f"{course}.lock", "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"Waiting for another upload of course {course} to finish")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def load_manifest(course: str):
+    """
+    Load a course manifest: {relative_path: {"sha256": ..., "point_ids": [...]}}.
+    Returns an empty manifest if the course has never been ingested.
+    """
+    path = manifest_path(course)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))["files"]
+
+
+def save_manifest(course: str, files):
+    MANIFEST_DIR.mkdir(parents=True, exist_ok=True)
+    path = manifest_path(course)
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps({"course": course, "files": files}, indent=1), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+def remap_manifest_point_ids(mapping):
+    """Rewrite every course manifest with new point IDs, e.g. after re-embedding with another model."""
+    if not MANIFEST_DIR.exists():
+        return
+    for path in MANIFEST_DIR.glob("*.json"):
+        with course_lock(path.stem):
+            files = load_manifest(path.stem)
+            for entry in files.values():
+                entry["point_ids"] = sorted({mapping.get(point_id, point_id) for point_id in entry["point_ids"]})
+            save_manifest(path.stem, files)
+
+
+def diff_manifest(old_files, hashes):
+    """
+    Compare a manifest against {relative_path: sha256} of a new upload.
+    Returns (added, changed, removed, unchanged) lists of relative paths.
+    """
+    added = [path for path in hashes if path not in old_files]
+    changed = [path for path in hashes if path in old_files and old_files[path]["sha256"] != hashes[path]]
+    unchanged = [path for path in hashes if path in old_files and old_files[path]["sha256"] == hashes[path]]
+    removed = [path for path in old_files if path not in hashes]
+    return added, changed, removed, unchanged
+
+
+def _point_ids_used_elsewhere(course: str):
+    """Point IDs referenced by other courses, which must survive deletion."""
+    used = set()
+    if not MANIFEST_DIR.exists():
+        return used
+    for path in MANIFEST_DIR.glob("*.json"):
+        if path != manifest_path(course):
+            for entry in json.loads(path.read_text(encoding="utf-8"))["files"].values():
+                used.update(entry["point_ids"])
+    return used
+
+
+def iter_course_files(source: Path):
+    """(relative path, file) pairs for a course directory or a course zip read in place."""
+    source = Path(source)
+    if source.is_dir():
+        for file_path in iter_directory_files(source):
+            yield file_path.relative_to(source).as_posix(), file_path
+    else:
+        for member in iter_zip_members(source):
+            yield member.name, member
+
+
+async def ingest_course(source: Path, course: str, incremental: bool = True, chunk_pdf_by_page: bool = True, progress=None, payload=None):
+    """
+    Ingest a course from a directory or zip and record its files and point IDs
+    in the course manifest. Every new point is tagged with the course and any
+    extra `payload` fields.
+
+    With incremental=True, only files added or changed since the last upload
+    are processed, and the points of removed or changed files are deleted.
+    Otherwise every file is processed and files missing from this upload stay
+    in the manifest, so their points are kept as before. Waits for a running
+    reindex, see store.collection_lock.
+    """
+    with collection_lock(), course_lock(course):
+        return await _ingest_course(source, course, incremental, chunk_pdf_by_page, progress, payload)
+
+
+async def _ingest_course(source, course, incremental, chunk_pdf_by_page, progress, payload):
+    old_files = load_manifest(course)
+    paths = dict(iter_course_files(source))
+    names = {file_path: path for path, file_path in paths.items()}
+    hashes = {path: hash_file(file_path) for path, file_path in paths.items()}
+    added, changed, removed, unchanged = diff_manifest(old_files, hashes)
+    print(f"Course {course}: {len(added)} added, {len(changed)} changed, {len(removed)} removed, {len(unchanged)} unchanged files")
+
+    if incremental:
+        kept, process, replaced = unchanged, added + changed, changed + removed
+    else:
+        kept, process, replaced = removed, added + changed + unchanged, changed + unchanged
+    new_files = {path: old_files[path] for path in kept}
+    for path in process:
+        new_files[path] = {"sha256": hashes[path], "point_ids": []}
+
+    def record(file_paths, point_ids):
+        for file_path, point_id in zip(file_paths, point_ids):
+            new_files[names[file_path]]["point_ids"].append(point_id)
+
+    chunk_count = await ingest_files(
+        [paths[path] for path in sorted(process)],
+        chunk_pdf_by_page=chunk_pdf_by_page,
+        on_batch=record,
+        build_graph=False,
+        progress=progress,
+        payload={**(payload or {}), "course": course},
+    )
+    for entry in new_files.values():
+        entry["point_ids"] = sorted(set(entry["point_ids"]))
+
+    # Content-addressed IDs may be shared, so only drop points nothing references anymore
+    still_used = _point_ids_used_elsewhere(course)
+    for entry in new_files.values():
+        still_used.update(entry["point_ids"])
+    stale = {point_id for path in replaced for point_id in old_files[path]["point_ids"]} - still_used
+    removed_nodes = node_labels(client, COLLECTION_NAME, sorted(stale))
+    delete_points(sorted(stale))
+    if stale:
+        result_cache.clear()
+
+    # Update edges after deleting, so no neighbor points at a removed node
+    if chunk_count or stale:
+        added_ids = {point_id for path in process for point_id in new_files[path]["point_ids"]}
+        await asyncio.to_thread(update_concept_graph, client, COLLECTION_NAME, added_ids, removed_nodes)
+
+    save_manifest(course, new_files)
+    return {
+        "added": len(added),
+        "changed": len(changed),
+        "removed": len(removed),
+        "unchanged": len(unchanged),
+        "chunks_added": chunk_count,
+        "points_deleted": len(stale),
+    }
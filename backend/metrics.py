@@ -0,0 +1,162 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+from config import settings
+
+# --- Configuration ---
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)  # histogram upper bounds in seconds
+RECENT_SAMPLES = 1024  # latencies kept per stage for percentiles
+PROFILE_DIR = settings.upload_dir / "profiles"  # cProfile dumps, one per profiled run
+PROFILE_TOP = 25  # functions printed after a profiled run
+
+_local = threading.local()
+
+
+class Histogram:
+    """Latency histogram of one stage, with item counts for throughput."""
+
+    def __init__(self):
+        self.count = 0
+        self.items = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds: float, items: int = 1):
+        self.count += 1
+        self.items += items
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.recent.append(seconds)
+
+    def snapshot(self):
+        recent = sorted(self.recent)
+
+        def percentile(q):
+            return recent[min(int(q * len(recent)), len(recent) - 1)] * 1000 if recent else 0.0
+
+        return {
+            "count": self.count,
+            "items": self.items,
+            "total_seconds": round(self.total, 4),
+            "items_per_second": round(self.items / self.total, 2) if self.total else 0.0,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(percentile(0.5), 3),
+            "p95_ms": round(percentile(0.95), 3),
+            "max_ms": round(self.max * 1000, 3),
+            "buckets": {
+                **{f"le_{bound:g}s": n for bound, n in zip(BUCKETS, self.buckets)},
+                "inf": self.buckets[-1],
+            },
+        }
+
+
+class Metrics:
+    """Thread-safe registry of per-stage histograms."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, items: int = 1):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds, items)
+        captured = getattr(_local, "captured", None)
+        if captured is not None:
+            captured.append((name, seconds, items))
+
+    def merge(self, observations):
+        """Record (name, seconds, items) observations captured in another process."""
+        for name, seconds, items in observations:
+            self.record(name, seconds, items)
+
+    def snapshot(self):
+        with self._lock:
+            stages = {name: histogram.snapshot() for name, histogram in sorted(self._histograms.items())}
+        return {"uptime_seconds": round(time.time() - self.started, 1), "stages": stages}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.started = time.time()
+
+    def summary(self):
+        """Plain-text table of every stage, slowest total first."""
+        stages = self.snapshot()["stages"]
+        lines = [f"{'stage':<18} {'count':>7} {'total':>9} {'mean':>9} {'p95':>9} {'items/s':>10}"]
+        for name, stage in sorted(stages.items(), key=lambda item: -item[1]["total_seconds"]):
+            lines.append(
+                f"{name:<18} {stage['count']:>7} {stage['total_seconds']:>8.2f}s {stage['mean_ms']:>7.1f}ms "
+                f"{stage['p95_ms']:>7.1f}ms {stage['items_per_second']:>10.1f}"
+            )
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+
+class span:
+    """
+    Time a block as one observation of a stage:
+
+        with span("embed") as s:
+            ...
+            s.items = len(chunks)
+    """
+
+    def __init__(self, name: str, items: int = 1):
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        metrics.record(self.name, time.perf_counter() - self.started, self.items)
+
+
+@contextmanager
+def captured():
+    """Collect the observations recorded by this thread, e.g. in a worker process to send back to the parent."""
+    previous = getattr(_local, "captured", None)
+    _local.captured = observations = []
+    try:
+        yield observations
+    finally:
+        _local.captured = previous
+
+
+@contextmanager
+def profile(name: str):
+    """
+    cProfile the enclosed block, dump the stats to PROFILE_DIR/<name>.prof and
+    print the top functions by cumulative time. Only the calling thread is
+    profiled; parsing in the pipeline's worker thread and processes shows up
+    in the pdf_parse and chunking stages instead.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        path = PROFILE_DIR / f"{name}.prof"
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        print(out.getvalue())
+        print(f"Profile saved to {path}")
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import threading
+import time
+from pathlib import Path
+
+from digesting import iter_directory_files, iter_file_chunks, iter_zip_members
+from graph import update_concept_graph
+from search import result_cache
+from vectorizer import add_chunks_to_qdrant, client, COLLECTION_NAME, EMBED_BATCH_SIZE, EMBED_CONCURRENCY
+
+# --- Configuration ---
+BATCH_SIZE = EMBED_BATCH_SIZE  # chunks per embed + upsert batch
+QUEUE_SIZE = 4  # batches buffered between parsing and embedding
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", min(os.cpu_count() or 1, 4)))  # PDF parsing processes per ingestion; every running job gets its own pool
+
+
+def iter_batches(items, batch_size: int = BATCH_SIZE):
+    """Group an iterable into lists of at most batch_size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _count_files(chunks, progress):
+    """Pass (file_path, chunk) pairs through, counting each source file once."""
+    previous = None
+    for file_path, chunk in chunks:
+        if file_path != previous:
+            progress["files_parsed"] += 1
+            previous = file_path
+        yield file_path, chunk
+
+
+async def ingest_files(files, chunk_pdf_by_page: bool = True, batch_size: int = BATCH_SIZE, queue_size: int = QUEUE_SIZE, workers: int = EXTRACT_WORKERS, concurrency: int = EMBED_CONCURRENCY, on_batch=None, build_graph: bool = True, progress=None, payload=None):
+    """
+    Stream files through extract -> chunk -> embed -> upsert.
+
+    Parsing runs in a worker thread and hands batches to the embedder through a
+    bounded queue, so memory stays flat regardless of course size and embedding
+    overlaps with PDF parsing. PDF parsing itself is spread over `workers`
+    processes. Up to `concurrency` batches are embedded at once; a new batch is
+    only taken off the queue when one finishes, which blocks the parser once the
+    queue is full. If given, on_batch(file_paths, point_ids) is called after
+    each batch is upserted, with the source file of every chunk. Once everything
+    is upserted the new points are linked into the concept graph unless
+    build_graph is False.
+    If a progress dict is given, its files_parsed, chunks_embedded and
+    points_upserted counters are advanced as work completes. Fields in
+    `payload` (e.g. course, upload_id) are stored on every point.
+    Returns the number of chunks added.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            chunks = iter_file_chunks(files, chunk_pdf_by_page=chunk_pdf_by_page, workers=workers)
+            if progress is not None:
+                chunks = _count_files(chunks, progress)
+            for batch in iter_batches(chunks, batch_size):
+                if stop.is_set():
+                    return
+                put(batch)
+        finally:
+            put(None)
+
+    slots = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    added_ids = []
+    total = 0
+
+    async def upload(batch):
+        nonlocal total
+        try:
+            point_ids = await add_chunks_to_qdrant([chunk for _, chunk in batch], progress=progress, payload=payload)
+            total += len(batch)
+            added_ids.extend(point_ids)
+            if on_batch is not None:
+                on_batch([file_path for file_path, _ in batch], point_ids)
+        finally:
+            slots.release()
+
+    started = time.perf_counter()
+    producer = loop.run_in_executor(None, produce)
+    produced_all = False
+    try:
+        while True:
+            await slots.acquire()
+            # Surface failed batches before taking on more work
+            for task in [task for task in in_flight if task.done()]:
+                in_flight.discard(task)
+                task.result()
+
+            batch = await queue.get()
+            if batch is None:
+                produced_all = True
+                break
+            in_flight.add(asyncio.create_task(upload(batch)))
+
+        await asyncio.gather(*in_flight)
+    except BaseException:
+        for task in in_flight:
+            task.cancel()
+        # Tell the producer to stop and drain the queue so it is never blocked on put(),
+        # unless the end-of-stream marker was already taken off the queue
+        stop.set()
+        while not produced_all and await queue.get() is not None:
+            pass
+        raise
+    finally:
+        await producer
+
+    elapsed = time.perf_counter() - started
+    print(f"Ingested {total} chunks in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.1f} chunks/s)")
+
+    if total:
+        result_cache.clear()
+    if build_graph and total:
+        await asyncio.to_thread(update_concept_graph, client, COLLECTION_NAME, added_ids)
+    return total
+
+
+async def ingest_directory(directory: Path, **kwargs):
+    """
+    Stream every file in a directory through the ingestion pipeline.
+    Accepts the same options as ingest_files.
+    """
+    return await ingest_files(iter_directory_files(directory), **kwargs)
+
+
+async def ingest_zip(zip_path: Path, **kwargs):
+    """
+    Stream every file inside a course zip through the ingestion pipeline,
+    reading members in place instead of extracting the archive to disk.
+    Accepts the same options as ingest_files.
+    """
+    return await ingest_files(iter_zip_members(zip_path), **kwargs)
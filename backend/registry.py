@@ -0,0 +1,85 @@
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+
+from config import settings
+
+# --- Configuration ---
+UPLOAD_DIR = settings.upload_dir
+REGISTRY_DB = UPLOAD_DIR / "registry.sqlite3"
+
+
+def _connect():
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(REGISTRY_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS uploads ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT NOT NULL, course TEXT NOT NULL, "
+        "source TEXT NOT NULL, status TEXT NOT NULL, bytes INTEGER, "
+        "file_count INTEGER, chunk_count INTEGER, error TEXT, "
+        "created_at REAL NOT NULL, started_at REAL, finished_at REAL, elapsed REAL)"
+    )
+    return conn
+
+
+def allocate_upload(filename: str, source: str) -> int:
+    """
+    Atomically allocate a new upload ID and record the upload as pending.
+    IDs are unique across restarts and across processes sharing UPLOAD_DIR.
+    """
+    with closing(_connect()) as conn:
+        cursor = conn.execute(
+            "INSERT INTO uploads (filename, course, source, status, created_at) VALUES (?, ?, ?, 'pending', ?)",
+            (filename, Path(filename).stem, source, time.time()),
+        )
+        return cursor.lastrowid
+
+
+def upload_zip_path(upload_id: int) -> Path:
+    """Where the zip of an upload is stored."""
+    return UPLOAD_DIR / f"{upload_id}.zip"
+
+
+def update_upload(upload_id: int, **fields):
+    """Set metadata columns (status, bytes, file_count, chunk_count, error, ...) of an upload."""
+    if not fields:
+        return
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with closing(_connect()) as conn:
+        conn.execute(f"UPDATE uploads SET {columns} WHERE id = ?", (*fields.values(), upload_id))
+
+
+def start_upload(upload_id: int):
+    update_upload(upload_id, status="processing", started_at=time.time())
+
+
+def finish_upload(upload_id: int, file_count: int = None, chunk_count: int = None, error: str = None):
+    """Mark an upload done (or failed, if error is given) and record its timing."""
+    now = time.time()
+    upload = get_upload(upload_id)
+    started_at = upload["started_at"] if upload and upload["started_at"] else now
+    update_upload(
+        upload_id,
+        status="failed" if error else "done",
+        file_count=file_count,
+        chunk_count=chunk_count,
+        error=error,
+        finished_at=now,
+        elapsed=now - started_at,
+    )
+
+
+def get_upload(upload_id: int):
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def list_uploads(limit: int = 100):
+    """Most recent uploads first."""
+    with closing(_connect()) as conn:
+        rows = conn.execute("SELECT * FROM uploads ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,181 @@
+import re
+import shutil
+import time
+
+from graph import build_concept_graph, graph_path, neighbor_cache, node_label, node_labels, update_concept_graph
+from lexical import lexical_index
+from manifest import remap_manifest_point_ids
+from search import result_cache
+from store import collection_lock, create_collection, ensure_indexes, resolve_alias, switch_alias, upsert_points, versioned_name
+from vectorizer import client, embed_chunks, point_id_for_chunk, run, COLLECTION_NAME
+
+# --- Configuration ---
+REINDEX_BATCH_SIZE = 256  # points copied or re-embedded per request
+REINDEX_CATCH_UP_PASSES = 10  # diff passes against the source before giving up on it going quiet
+
+
+def next_version(alias):
+    """Collection name for the next version behind an alias, e.g. knowledge_v3."""
+    pattern = re.compile(rf"^{re.escape(alias)}_v(\d+)$")
+    versions = [
+        int(match.group(1))
+        for collection in client.get_collections().collections
+        if (match := pattern.match(collection.name))
+    ]
+    return versioned_name(alias, max(versions, default=0) + 1)
+
+
+def _scroll_ids(collection_name):
+    ids, offset = set(), None
+    while True:
+        points, offset = client.scroll(collection_name=collection_name, limit=10000, offset=offset, with_payload=False, with_vectors=False)
+        ids.update(point.id for point in points)
+        if offset is None:
+            return ids
+
+
+def _iter_source_batches(source, point_ids, with_vectors):
+    """Batches of points from source: all of them, or only `point_ids` if given."""
+    if point_ids is not None:
+        for i in range(0, len(point_ids), REINDEX_BATCH_SIZE):
+            yield client.retrieve(collection_name=source, ids=point_ids[i:i + REINDEX_BATCH_SIZE], with_payload=True, with_vectors=with_vectors)
+        return
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=source, limit=REINDEX_BATCH_SIZE, offset=offset, with_payload=True, with_vectors=with_vectors)
+        if points:
+            yield points
+        if offset is None:
+            return
+
+
+async def _copy_points(source, target, point_ids, reembed, options, progress):
+    """
+    Copy points from source to target, creating target on the first batch.
+    With reembed, vectors are recomputed from the chunk text with the current
+    model and points get new content-addressed IDs. Returns {old_id: new_id}.
+    """
+    from qdrant_client.http.models import PointStruct
+
+    mapping = {}
+    for points in _iter_source_batches(source, point_ids, with_vectors=not reembed):
+        if reembed:
+            vectors = await embed_chunks([point.payload["text"] for point in points])
+            if progress is not None:
+                progress["chunks_embedded"] += len(points)
+        else:
+            vectors = [point.vector for point in points]
+
+        if not client.collection_exists(target):
+            create_collection(client, target, vector_size=len(vectors[0]), **options)
+
+        upserts = []
+        for point, vector in zip(points, vectors):
+            payload = dict(point.payload)
+            point_id = point_id_for_chunk(payload["text"]) if reembed else point.id
+            if point_id != point.id:
+                payload["node"] = node_label(payload["text"], point_id)
+            mapping[point.id] = point_id
+            upserts.append(PointStruct(id=point_id, vector=vector, payload=payload))
+        await upsert_points(target, upserts)
+        if progress is not None:
+            progress["points_upserted"] += len(upserts)
+    return mapping
+
+
+async def _catch_up(source, target, mapping, reembed, options, progress):
+    """
+    Copy points added to source since they were copied and drop the ones
+    deleted from it, repeating until a pass finds nothing to do, so writes
+    that land during a pass are not lost. `mapping` ({source_id: target_id})
+    is kept up to date. Returns the target IDs added and the node labels
+    removed, for updating the concept graph.
+    """
+    added, removed_nodes = [], []
+    for _ in range(REINDEX_CATCH_UP_PASSES):
+        source_ids = _scroll_ids(source)
+        missing = sorted(source_ids - mapping.keys(), key=str)
+        removed = {mapping.pop(point_id) for point_id in list(mapping) if point_id not in source_ids}
+        removed = sorted(removed - set(mapping.values()), key=str)  # re-embedded duplicates share a target point
+        if not missing and not removed:
+            return added, removed_nodes
+        if missing:
+            copied = await _copy_points(source, target, missing, reembed, options, progress)
+            mapping.update(copied)
+            added.extend(copied.values())
+        if removed:
+            removed_nodes.extend(node_labels(client, target, removed))
+            client.delete(collection_name=target, points_selector=removed)
+    print(f"Source {source} still changing after {REINDEX_CATCH_UP_PASSES} catch-up passes; switching anyway")
+    return added, removed_nodes
+
+
+async def reindex(alias: str = COLLECTION_NAME, reembed: bool = False, drop_previous: bool = False, progress=None, **options):
+    """
+    Build a new version of the collection behind `alias` and switch the alias
+    to it once complete, so searches keep working meanwhile.
+
+    Points are copied in bulk with their vectors, or re-embedded from their
+    text with the current model when reembed=True (needed after a model
+    change; manifests are updated to the new point IDs and the concept graph
+    is rebuilt). `options` are storage settings for the new version, see
+    store.create_collection. Uploads, from jobs or the CLI, wait until the
+    switch (see store.collection_lock), so no payload changes while points
+    are copied; points added or deleted by other writers are reconciled pass
+    after pass until the source is quiet, right before the switch, and
+    unlinked from the concept graph. An existing non-alias collection named
+    `alias` is migrated to versioned storage. The previous version is kept for
+    rollback unless drop_previous=True.
+    """
+    with collection_lock(exclusive=True):
+        return await _reindex(alias, reembed, drop_previous, progress, options)
+
+
+async def _reindex(alias, reembed, drop_previous, progress, options):
+    started = time.perf_counter()
+    source = resolve_alias(client, alias) or alias
+    target = next_version(alias)
+    print(f"Reindexing {alias}: {source} -> {target} ({'re-embedding' if reembed else 'copying vectors'})")
+
+    mapping = await _copy_points(source, target, None, reembed, options, progress)
+    if not client.collection_exists(target):
+        create_collection(client, target, **options)
+    added, removed_nodes = await _catch_up(source, target, mapping, reembed, options, progress)
+
+    ensure_indexes(client, target)
+    if reembed:
+        # The new graph covers every point copied so far
+        build_concept_graph(client, target)
+        added, removed_nodes = [], []
+    elif graph_path(alias).exists():
+        # Copied points keep their edges, so the target starts from the current graph
+        shutil.copyfile(graph_path(alias), graph_path(target))
+    # Writes that reached the alias while indexing are copied over right before the switch
+    more_added, more_removed = await _catch_up(source, target, mapping, reembed, options, progress)
+    added, removed_nodes = added + more_added, removed_nodes + more_removed
+    if added or removed_nodes:
+        update_concept_graph(client, target, added, removed_nodes)
+    if graph_path(target).exists():
+        graph_path(target).replace(graph_path(alias))
+    if reembed:
+        remap_manifest_point_ids({old: new for old, new in mapping.items() if old != new})
+
+    if source == alias:
+        # A plain collection cannot share its name with an alias, so it has to go first
+        client.delete_collection(alias)
+    switch_alias(client, alias, target)
+    if alias == COLLECTION_NAME:
+        # Re-embedding changes point IDs; rebuilding also covers chunks ingested before the lexical index existed
+        lexical_index.rebuild(client, alias)
+    neighbor_cache.clear()
+    result_cache.clear()
+
+    if drop_previous and source != alias:
+        client.delete_collection(source)
+    elapsed = time.perf_counter() - started
+    print(f"Reindexed {len(mapping)} points into {target} in {elapsed:.1f}s")
+    return {"alias": alias, "previous": source, "collection": target, "points": len(mapping), "elapsed": round(elapsed, 3)}
+
+
+if __name__ == "__main__":
+    print(run(reindex()))
@@ -0,0 +1,133 @@
+import asyncio
+import os
+
+from caching import LRUCache
+from config import settings
+from embedding_cache import normalize_chunk
+from lexical import lexical_index
+from metrics import span
+from store import search_params
+from vectorizer import client, embed_chunks, COLLECTION_NAME
+
+# --- Configuration ---
+SEARCH_LIMIT = 10  # chunks returned per query by default
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+SEARCH_MODE = settings.search_mode  # default retrieval mode, see search()
+HYBRID_CANDIDATES = 3  # hits fetched from each retriever per result before fusing
+RRF_K = 60  # rank offset of reciprocal rank fusion; larger values flatten the rank weights
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 1024))  # query embeddings kept in memory
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 1024))  # search results kept in memory
+RESULT_CACHE_TTL = 60  # seconds before a cached result list is searched again
+
+# Query text -> embedding; embeddings never go stale for a fixed model
+query_cache = LRUCache(QUERY_CACHE_SIZE)
+# (query, limit, course, upload_id, mode) -> ranked hits; cleared whenever points are added or removed
+result_cache = LRUCache(RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+
+
+async def embed_query(query: str):
+    """Embed a search query with the same model as the stored chunks, reusing cached vectors."""
+    key = normalize_chunk(query)
+    vector = query_cache.get(key)
+    if vector is None:
+        vector = (await embed_chunks([key]))[0]
+        query_cache.put(key, vector)
+    return vector
+
+
+def _search_filter(course: str = None, upload_id: int = None):
+    from qdrant_client.http.models import FieldCondition, Filter, MatchValue
+
+    conditions = []
+    if course is not None:
+        conditions.append(FieldCondition(key="course", match=MatchValue(value=course)))
+    if upload_id is not None:
+        conditions.append(FieldCondition(key="upload_id", match=MatchValue(value=upload_id)))
+    return Filter(must=conditions) if conditions else None
+
+
+async def vector_search(query: str, limit: int, course: str = None, upload_id: int = None):
+    """Chunks nearest to the query embedding in Qdrant, best first."""
+    vector = await embed_query(query)
+    with span("qdrant_query"):
+        response = await asyncio.to_thread(
+            client.query_points,
+            collection_name=COLLECTION_NAME,
+            query=vector,
+            query_filter=_search_filter(course, upload_id),
+            limit=limit,
+            search_params=search_params(),
+            with_payload=True,
+        )
+    return [
+        {
+            "id": point.id,
+            "score": point.score,
+            "text": point.payload.get("text"),
+            "node": point.payload.get("node"),
+            "course": point.payload.get("course"),
+            "upload_id": point.payload.get("upload_id"),
+        }
+        for point in response.points
+    ]
+
+
+async def lexical_search(query: str, limit: int, course: str = None, upload_id: int = None):
+    """Chunks ranked by BM25 over the query words, without embedding the query."""
+    with span("lexical_query"):
+        return await asyncio.to_thread(lexical_index.search, query, limit, course, upload_id)
+
+
+def fuse(rankings, limit: int, k: int = RRF_K):
+    """
+    Reciprocal rank fusion: each hit scores sum(1 / (k + rank)) over the
+    rankings it appears in, so chunks ranked well by both retrievers come
+    first and the retrievers' incomparable scores are never mixed.
+    """
+    fused = {}
+    for hits in rankings:
+        for rank, hit in enumerate(hits, 1):
+            entry = fused.setdefault(str(hit["id"]), {**hit, "score": 0.0})
+            entry["score"] += 1 / (k + rank)
+    return sorted(fused.values(), key=lambda hit: -hit["score"])[:limit]
+
+
+async def search(query: str, limit: int = SEARCH_LIMIT, course: str = None, upload_id: int = None, mode: str = SEARCH_MODE):
+    """
+    Return the chunks best matching the query, best first, optionally
+    restricted to one course and/or upload. Each hit is a dict with id, score,
+    text, node, course and upload_id.
+
+    mode is "vector" (semantic similarity), "lexical" (BM25 keyword match, no
+    embedding round-trip) or "hybrid" (both, fused by rank). If vector search
+    fails in hybrid mode, e.g. because Ollama is down, the keyword ranking is
+    returned on its own and not cached.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}, expected one of {', '.join(SEARCH_MODES)}")
+    key = (normalize_chunk(query), limit, course, upload_id, mode)
+    hits = result_cache.get(key)
+    if hits is not None:
+        return hits
+
+    if mode == "vector":
+        hits = await vector_search(query, limit, course, upload_id)
+    elif mode == "lexical":
+        hits = await lexical_search(query, limit, course, upload_id)
+    else:
+        candidates = limit * HYBRID_CANDIDATES
+        lexical, vector = await asyncio.gather(
+            lexical_search(query, candidates, course, upload_id),
+            vector_search(query, candidates, course, upload_id),
+            return_exceptions=True,
+        )
+        if isinstance(lexical, BaseException):
+            raise lexical
+        if isinstance(vector, BaseException):
+            if not isinstance(vector, Exception):
+                raise vector
+            print(f"Vector search failed ({vector!r}), returning keyword matches only")
+            return lexical[:limit]
+        hits = fuse([lexical, vector], limit)
+    result_cache.put(key, hits)
+    return hits
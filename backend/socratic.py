@@ -0,0 +1,160 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from caching import LRUCache
+from config import settings
+from metrics import metrics, span
+
+# --- Configuration ---
+OLLAMA_MODEL = settings.chat_model  # Socratic chat model
+QUESTION_CACHE_SIZE = 256  # generated questions kept in memory
+PREFETCH_WORKERS = 2  # background ollama.chat calls at once
+PREFETCH_FANOUT = 3  # neighbors of the current node to prefetch questions for
+
+PROMPT = """
+You are a teacher using the Socratic method.
+Your goal is to ask guiding questions to help the learner understand the topic.
+
+Current node: {node}
+Neighbors: {neighbors}
+
+Ask one guiding question to help the student explore this node and its neighbors.
+"""
+
+
+class QuestionCache(LRUCache):
+    """Thread-safe LRU cache of questions keyed on (node, neighbors, model)."""
+
+    def __init__(self, max_size: int = QUESTION_CACHE_SIZE):
+        super().__init__(max_size)
+
+    @staticmethod
+    def key(node, neighbors, model):
+        return node, tuple(neighbors), model
+
+
+question_cache = QuestionCache()
+
+
+def socratic_question(node, neighbors, model: str = OLLAMA_MODEL):
+    """Generate a Socratic question for the node using Ollama, reusing cached questions."""
+    key = QuestionCache.key(node, neighbors, model)
+    question = question_cache.get(key)
+    if question is None:
+        from ollama import chat
+
+        prompt = PROMPT.format(node=node, neighbors=neighbors)
+        with span("llm_chat"):
+            response = chat(model=model, messages=[{"role": "user", "content": prompt}])
+        question = response.message.content
+        question_cache.put(key, question)
+    return question
+
+
+def stream_socratic_question(node, neighbors, model: str = OLLAMA_MODEL):
+    """
+    Yield a Socratic question token by token as Ollama generates it.
+    Cached questions are yielded whole; finished streams are added to the cache.
+    """
+    key = QuestionCache.key(node, neighbors, model)
+    question = question_cache.get(key)
+    if question is not None:
+        yield question
+        return
+
+    from ollama import chat
+
+    prompt = PROMPT.format(node=node, neighbors=neighbors)
+    parts = []
+    # Only time spent waiting on Ollama counts, not time the caller spends per token
+    started = time.perf_counter()
+    stream = iter(chat(model=model, messages=[{"role": "user", "content": prompt}], stream=True))
+    elapsed = 0.0
+    while True:
+        part = next(stream, None)
+        elapsed += time.perf_counter() - started
+        if part is None:
+            break
+        token = part.message.content
+        if token:
+            if not parts:
+                metrics.record("llm_first_token", elapsed)
+            parts.append(token)
+            yield token
+        started = time.perf_counter()
+    metrics.record("llm_chat", elapsed)
+    question_cache.put(key, "".join(parts))
+
+
+class QuestionPrefetcher:
+    """
+    Generates questions for likely next nodes in the background.
+
+    While the learner reads the current question, prefetch() starts generating
+    questions for the first few neighbors; stream() returns a cached or
+    in-flight question instead of calling Ollama again. Prefetches for nodes
+    the learner moved away from are cancelled, so they don't hold up the
+    foreground question.
+    """
+
+    def __init__(self, neighbors_of, model: str = OLLAMA_MODEL, workers: int = PREFETCH_WORKERS, fanout: int = PREFETCH_FANOUT):
+        self.neighbors_of = neighbors_of
+        self.model = model
+        self.fanout = fanout
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._pending = {}  # node -> future
+        self._lock = threading.Lock()
+
+    def _generate(self, node):
+        neighbors = self.neighbors_of(node)
+        return neighbors, socratic_question(node, neighbors, model=self.model)
+
+    def _drop_pending(self, keep):
+        """
+        Cancel and forget prefetches for nodes outside `keep`; call with the lock held.
+        Generations already running can't be interrupted, but their questions still land in the cache.
+        """
+        for node in [node for node in self._pending if node not in keep]:
+            self._pending.pop(node).cancel()
+
+    def prefetch(self, neighbors):
+        """Start generating questions for the first `fanout` neighbors, dropping stale prefetches."""
+        wanted = neighbors[:self.fanout]
+        with self._lock:
+            self._drop_pending(wanted)
+            for node in wanted:
+                if node not in self._pending:
+                    self._pending[node] = self._pool.submit(self._generate, node)
+
+    def _take_prefetched(self, node, neighbors):
+        """
+        Result of a prefetch for this node, waiting if it is still in flight;
+        None if unavailable. Prefetches for the other nodes are dropped, since
+        the learner moved here instead.
+        """
+        with self._lock:
+            future = self._pending.pop(node, None)
+            self._drop_pending(())
+        if future is None or future.cancelled():
+            return None
+        try:
+            prefetched_neighbors, question = future.result()
+        except Exception as e:
+            print(f"Prefetching a question for {node} failed: {e}")
+            return None
+        return question if list(prefetched_neighbors) == list(neighbors) else None
+
+    def stream(self, node, neighbors):
+        """
+        Question for a node: the prefetched one if available (waiting on it if
+        still in flight), otherwise streamed token by token from Ollama.
+        """
+        question = self._take_prefetched(node, neighbors)
+        if question is not None:
+            yield question
+        else:
+            yield from stream_socratic_question(node, neighbors, model=self.model)
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,296 @@
+import asyncio
+import fcntl
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from config import settings
+from graph import ensure_node_index
+from metrics import metrics, span
+
+# qdrant_client takes about a second to import, so it is only imported once a client or model is needed
+
+# --- Configuration ---
+UPSERT_BATCH_SIZE = int(os.environ.get("UPSERT_BATCH_SIZE", 256))  # points per upsert request
+UPSERT_CONCURRENCY = int(os.environ.get("UPSERT_CONCURRENCY", 4))  # upsert requests in flight
+UPSERT_RETRIES = 3
+UPSERT_RETRY_DELAY = 0.5  # seconds, doubled after every failed attempt
+
+QUANTIZATION_KINDS = ("none", "scalar", "binary")
+COLLECTION_LOCK_PATH = settings.upload_dir / "collection.lock"
+
+_client = None
+_client_lock = threading.Lock()
+_collection_ready = False
+_collection_lock = threading.Lock()
+# One async client per event loop, since its connections are bound to the loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _client_options():
+    if settings.qdrant_location:
+        return {"location": settings.qdrant_location}
+    return {
+        "host": settings.qdrant_host,
+        "port": settings.qdrant_port,
+        "grpc_port": settings.qdrant_grpc_port,
+        "prefer_grpc": settings.qdrant_prefer_grpc,
+        "timeout": settings.qdrant_timeout,
+    }
+
+
+def get_client():
+    """Process-wide synchronous Qdrant client, created on first use; its connection pool is shared by every module."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from qdrant_client import QdrantClient
+            _client = QdrantClient(**_client_options())
+        return _client
+
+
+def get_collection_client():
+    """The shared client, after making sure the knowledge collection exists (checked once per process)."""
+    global _collection_ready
+    client = get_client()
+    if not _collection_ready:
+        # The startup warm-up and the first job can get here at the same time
+        with _collection_lock:
+            if not _collection_ready:
+                ensure_collection(client, settings.collection_name)
+                _collection_ready = True
+    return client
+
+
+def client_ready():
+    """Whether the shared client has been created and the collection checked, without connecting."""
+    return _collection_ready
+
+
+class LazyClient:
+    """
+    Stands in for the shared Qdrant client so modules can hold a `client`
+    global without connecting at import time. The first attribute access
+    creates the client and bootstraps the collection.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_collection_client(), name)
+
+
+client = LazyClient()
+
+
+@contextmanager
+def collection_lock(exclusive: bool = False):
+    """
+    Cross-process lock on writes to the knowledge collection. Uploads hold it
+    shared and run side by side; a reindex holds it exclusively, so no upload,
+    from a job or the CLI, changes points or payloads while they are copied.
+    """
+    COLLECTION_LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    with open(COLLECTION_LOCK_PATH, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, mode | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print("Waiting for running uploads to finish" if exclusive else "Waiting for a reindex to finish")
+            fcntl.flock(lock_file, mode)
+        yield
+
+
+def get_async_client():
+    """
+    Async Qdrant client for the running event loop, created on first use and
+    reused after that. None in local mode, where all access goes through the
+    single synchronous client that owns the local storage.
+    """
+    if settings.qdrant_location:
+        return None
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        from qdrant_client import AsyncQdrantClient
+        async_client = _async_clients[loop] = AsyncQdrantClient(**_client_options())
+    return async_client
+
+
+async def close_async_client():
+    """Close the async Qdrant client of the running event loop, if one was created."""
+    async_client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if async_client is not None:
+        await async_client.close()
+
+
+async def _upsert_batch(async_client, collection_name, batch, wait, semaphore):
+    """Upsert one batch, retrying with exponential backoff on failure."""
+    async with semaphore:
+        for attempt in range(UPSERT_RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                if async_client is None:
+                    result = await asyncio.to_thread(get_client().upsert, collection_name=collection_name, points=batch, wait=wait)
+                else:
+                    result = await async_client.upsert(collection_name=collection_name, points=batch, wait=wait)
+                metrics.record("upsert_request", time.perf_counter() - started, items=len(batch))
+                return result
+            except Exception as e:
+                if attempt == UPSERT_RETRIES:
+                    raise
+                delay = UPSERT_RETRY_DELAY * 2 ** attempt
+                print(f"Upserting {len(batch)} points failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+
+async def upsert_points(collection_name, points, batch_size: int = UPSERT_BATCH_SIZE, concurrency: int = UPSERT_CONCURRENCY):
+    """
+    Upsert points in batches of batch_size with up to `concurrency` requests
+    in flight. Batches are only acknowledged (wait=False) except the last one,
+    which is sent with wait=True once all others are acknowledged: updates are
+    applied in order, so when it returns every point is searchable.
+    """
+    if not points:
+        return
+    async_client = get_async_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    batches = [points[i:i + batch_size] for i in range(0, len(points), batch_size)]
+    with span("upsert", items=len(points)):
+        await asyncio.gather(*(_upsert_batch(async_client, collection_name, batch, False, semaphore) for batch in batches[:-1]))
+        await _upsert_batch(async_client, collection_name, batches[-1], True, semaphore)
+
+
+def quantization_config(kind: str = settings.quantization):
+    """Qdrant quantization settings for `kind`; quantized vectors always stay in RAM."""
+    from qdrant_client.http import models
+
+    if kind == "none":
+        return None
+    if kind == "scalar":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True))
+    if kind == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown quantization {kind!r}, expected one of {QUANTIZATION_KINDS}")
+
+
+def create_collection(
+    client,
+    collection_name,
+    quantization: str = settings.quantization,
+    vectors_on_disk: bool = settings.vectors_on_disk,
+    payload_on_disk: bool = settings.payload_on_disk,
+    hnsw_m: int = settings.hnsw_m,
+    hnsw_ef_construct: int = settings.hnsw_ef_construct,
+    hnsw_on_disk: bool = settings.hnsw_on_disk,
+    vector_size: int = settings.vector_size,
+    **kwargs,
+):
+    """Create a chunk collection with the configured storage layout. Extra kwargs go to client.create_collection."""
+    from qdrant_client.http import models
+
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE, on_disk=vectors_on_disk),
+        on_disk_payload=payload_on_disk,
+        hnsw_config=models.HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct, on_disk=hnsw_on_disk),
+        quantization_config=quantization_config(quantization),
+        **kwargs,
+    )
+
+
+def ensure_indexes(client, collection_name):
+    """Payload indexes used for neighbor lookups and for filtering search by course or upload."""
+    from qdrant_client.http import models
+
+    ensure_node_index(client, collection_name)
+    client.create_payload_index(collection_name=collection_name, field_name="course", field_schema=models.PayloadSchemaType.KEYWORD)
+    client.create_payload_index(collection_name=collection_name, field_name="upload_id", field_schema=models.PayloadSchemaType.INTEGER)
+
+
+def versioned_name(alias, version: int):
+    return f"{alias}_v{version}"
+
+
+def resolve_alias(client, alias):
+    """Name of the collection an alias points to, or None if it is not an alias."""
+    for entry in client.get_aliases().aliases:
+        if entry.alias_name == alias:
+            return entry.collection_name
+    return None
+
+
+def switch_alias(client, alias, collection_name):
+    """Atomically point an alias at a collection, replacing any previous target."""
+    from qdrant_client.http import models
+
+    operations = []
+    if resolve_alias(client, alias) is not None:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=operations)
+
+
+def ensure_collection(client, collection_name, **kwargs):
+    """
+    Make sure `collection_name` can be used, without ever deleting data.
+    A fresh install gets `<name>_v1` behind a `<name>` alias so it can later be
+    reindexed without downtime; an existing collection or alias is left as is.
+    Safe to race with another process bootstrapping the same collection.
+    """
+    if resolve_alias(client, collection_name) is None and not client.collection_exists(collection_name):
+        target = versioned_name(collection_name, 1)
+        try:
+            if not client.collection_exists(target):
+                create_collection(client, target, **kwargs)
+        except Exception:
+            # Someone else created it between the check and the request ("already exists")
+            if not client.collection_exists(target):
+                raise
+        try:
+            switch_alias(client, collection_name, target)
+        except Exception:
+            if resolve_alias(client, collection_name) != target:
+                raise
+    ensure_indexes(client, collection_name)
+
+
+def search_params(quantization: str = settings.quantization, hnsw_ef: int = settings.search_hnsw_ef):
+    """
+    Query-time parameters matching the collection layout. With quantization,
+    oversampled candidates are rescored against the original vectors.
+    """
+    from qdrant_client.http import models
+
+    if quantization == "none":
+        return models.SearchParams(hnsw_ef=hnsw_ef)
+    return models.SearchParams(
+        hnsw_ef=hnsw_ef,
+        quantization=models.QuantizationSearchParams(rescore=True, oversampling=settings.rescore_oversampling),
+    )
+
+
+def estimate_memory(
+    points: int,
+    payload_bytes: int = 0,
+    quantization: str = settings.quantization,
+    vectors_on_disk: bool = settings.vectors_on_disk,
+    payload_on_disk: bool = settings.payload_on_disk,
+    hnsw_m: int = settings.hnsw_m,
+    hnsw_on_disk: bool = settings.hnsw_on_disk,
+    dim: int = settings.vector_size,
+):
+    """
+    Rough resident memory in bytes of a collection, split by component.
+    Uses Qdrant's sizing rule of 1.5x the raw float32 size for in-RAM vectors;
+    the HNSW graph is about 2 * m links of 4 bytes per point on layer 0.
+    """
+    bytes_per_vector = {"none": 0, "scalar": dim, "binary": (dim + 7) // 8}[quantization]
+    estimate = {
+        "vectors": 0 if vectors_on_disk else int(points * dim * 4 * 1.5),
+        "quantized": points * bytes_per_vector,
+        "hnsw": 0 if hnsw_on_disk else points * hnsw_m * 2 * 4,
+        "payload": 0 if payload_on_disk else payload_bytes,
+    }
+    estimate["total"] = sum(estimate.values())
+    return estimate
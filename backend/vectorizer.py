@@ -1,51 +1,170 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams, Distance
-from ollama import embed
-import uuid
+import asyncio
+import os
+import time
+import weakref
+
+from config import settings
+from embedding_cache import EmbeddingCache, chunk_hash, point_id_from_hash
+from graph import node_label
+from lexical import lexical_index
+from metrics import metrics
+from store import client, client_ready, close_async_client, get_collection_client, upsert_points
 
 # --- Configuration ---
-QDRANT_HOST = "localhost"
-QDRANT_PORT = 6333
-COLLECTION_NAME = "knowledge"  # use a new collection
-OLLAMA_MODEL = "nomic-embed-text:latest"
-VECTOR_SIZE = 768  # dimension for nomic-embed-text
-
-# --- Initialize Qdrant client ---
-client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-
-# Delete old collection if it exists, then create new one
-if client.collection_exists(collection_name=COLLECTION_NAME):
-    client.delete_collection(collection_name=COLLECTION_NAME)
-
-client.create_collection(
-    collection_name=COLLECTION_NAME,
-    vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE)
-)
-
-def embed_chunks(chunks):
-    """Generate embeddings for multiple chunks at once using Ollama."""
-    response = embed(model=OLLAMA_MODEL, input=chunks)
-    if not response.embeddings:
-        raise ValueError("No embeddings returned from Ollama")
-    return response.embeddings
-
-async def add_chunks_to_qdrant(chunks):
-    """Add a list of text chunks to Qdrant."""
-    vectors = embed_chunks(chunks)
+COLLECTION_NAME = settings.collection_name  # alias of the live collection version, see reindex.py
+OLLAMA_MODEL = settings.embedding_model
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 32))  # chunks per Ollama request
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", 4))  # Ollama requests in flight
+EMBED_RETRIES = 3
+EMBED_RETRY_DELAY = 1.0  # seconds, doubled after every failed attempt
+
+embedding_cache = EmbeddingCache()
+
+# Creates the client embed_chunks sends requests to; see use_embedding_client
+_embedding_client_factory = None
+# One embedding client per event loop, since its connection pool is bound to the loop
+_embedding_clients = weakref.WeakKeyDictionary()
+
+# `client` (from store) connects and creates the collection on first use only;
+# existing data is kept across restarts.
+
+async def _embed_batch(ollama_client, batch, semaphore):
+    """Embed one batch, retrying with exponential backoff on failure."""
+    async with semaphore:
+        for attempt in range(EMBED_RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                response = await ollama_client.embed(model=OLLAMA_MODEL, input=batch)
+                if not response.embeddings:
+                    raise ValueError("No embeddings returned from Ollama")
+            except Exception as e:
+                if attempt == EMBED_RETRIES:
+                    raise
+                delay = EMBED_RETRY_DELAY * 2 ** attempt
+                print(f"Embedding batch of {len(batch)} chunks failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            elapsed = time.perf_counter() - started
+            metrics.record("embed_request", elapsed, items=len(batch))
+            return response.embeddings
+
+async def embed_chunks(chunks, batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY):
+    """
+    Generate embeddings for chunks using Ollama without blocking the event loop.
+    Chunks already in the embedding cache are not sent again; the rest are sent
+    batch_size at a time with at most `concurrency` requests in flight.
+    """
+    started = time.perf_counter()
+    keys = [chunk_hash(OLLAMA_MODEL, chunk) for chunk in chunks]
+    vectors = embedding_cache.get_many(keys)
+
+    # Deduplicate so a chunk repeated within the input is embedded only once
+    missing = {}
+    for key, chunk in zip(keys, chunks):
+        if key not in vectors:
+            missing.setdefault(key, chunk)
+
+    if missing:
+        ollama_client = get_embedding_client()
+        semaphore = asyncio.Semaphore(concurrency)
+        texts = list(missing.values())
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        results = await asyncio.gather(*(_embed_batch(ollama_client, batch, semaphore) for batch in batches))
+        fresh = dict(zip(missing, (vector for batch in results for vector in batch)))
+        embedding_cache.put_many(fresh)
+        vectors.update(fresh)
+
+    metrics.record("embed", time.perf_counter() - started, items=len(chunks))
+    return [vectors[key] for key in keys]
+
+def _ollama_client():
+    from ollama import AsyncClient
+    return AsyncClient()
+
+def get_embedding_client():
+    """Embedding client for the running event loop, created on first use and reused after that."""
+    loop = asyncio.get_running_loop()
+    embedding_client = _embedding_clients.get(loop)
+    if embedding_client is None:
+        embedding_client = _embedding_clients[loop] = (_embedding_client_factory or _ollama_client)()
+    return embedding_client
+
+async def close_clients():
+    """Close the pooled clients bound to the running event loop; call before the loop ends."""
+    embedding_client = _embedding_clients.pop(asyncio.get_running_loop(), None)
+    if hasattr(embedding_client, "close"):
+        await embedding_client.close()
+    await close_async_client()
+
+def run(coro):
+    """asyncio.run(coro), closing the loop's pooled clients before the loop goes away."""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await close_clients()
+    return asyncio.run(main())
+
+def use_embedding_client(factory=None):
+    """
+    Replace the Ollama client factory used by embed_chunks, e.g. with a
+    deterministic fake for benchmarks; None restores ollama.AsyncClient.
+    The factory's result must provide `await embed(model=..., input=[...])`
+    returning an object with `.embeddings`.
+    """
+    global _embedding_client_factory
+    _embedding_client_factory = factory
+    _embedding_clients.clear()
+
+def point_id_for_chunk(chunk):
+    """Deterministic point ID for a chunk, so re-uploading it overwrites the same point."""
+    return point_id_from_hash(chunk_hash(OLLAMA_MODEL, chunk))
+
+async def add_chunks_to_qdrant(chunks, progress=None, payload=None):
+    """
+    Add a list of text chunks to Qdrant and return their point IDs.
+    Fields in `payload` (e.g. course, upload_id) are stored on every point.
+    If a progress dict is given, its chunks_embedded and points_upserted counters are advanced.
+    """
+    from qdrant_client.http.models import PointStruct
+
+    vectors = await embed_chunks(chunks)
+    if progress is not None:
+        progress["chunks_embedded"] += len(chunks)
     points = []
 
     for chunk, vector in zip(chunks, vectors):
-        points.append({
-            "id": str(uuid.uuid4()),
-            "vector": vector,
-            "payload": {"text": chunk}
-        })
+        point_id = point_id_for_chunk(chunk)
+        points.append(PointStruct(
+            id=point_id,
+            vector=vector,
+            payload={**(payload or {}), "text": chunk, "node": node_label(chunk, point_id)},
+        ))
+
+    if not client_ready():
+        # Upserts go through the async client, so bootstrap the collection first
+        await asyncio.to_thread(get_collection_client)
+    await upsert_points(COLLECTION_NAME, points)
+    await asyncio.to_thread(lexical_index.add, [(point.id, point.payload) for point in points])
+    print(f"Inserted {len(points)} chunks into Qdrant.")
+    if progress is not None:
+        progress["points_upserted"] += len(points)
+    return [point.id for point in points]
 
-    client.upsert(
+def delete_points(point_ids):
+    """Remove points from Qdrant and the lexical index by ID."""
+    from qdrant_client.http.models import PointIdsList
+
+    point_ids = list(point_ids)
+    if not point_ids:
+        return
+    client.delete(
         collection_name=COLLECTION_NAME,
-        points=points
+        points_selector=PointIdsList(points=point_ids)
     )
-    print(f"Inserted {len(points)} chunks into Qdrant.")
+    lexical_index.delete(point_ids)
+    print(f"Deleted {len(point_ids)} chunks from Qdrant.")
 
 # --- Example usage ---
 if __name__ == "__main__":
@@ -55,4 +174,4 @@ if __name__ == "__main__":
         "Qdrant stores embeddings for semantic search.",
         "Ollama can generate embeddings locally."
     ]
-    add_chunks_to_qdrant(text_chunks)
+    run(add_chunks_to_qdrant(text_chunks))